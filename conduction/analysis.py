@@ -17,19 +17,35 @@ import numpy as np
 import logging
 from scipy import stats
 
+from conduction import blocking
 
-def final_conductivity_onlat(cur_dir, prob_m_cn, dt_dx_list, k_list, k_conv_error_buffer):
-    """Final conductivity calculation, the best way to do this is averaging the last so many k values"""
+
+def final_conductivity_onlat(cur_dir, prob_m_cn, dt_dx_list, k_list, k_conv_error_buffer, k_blocking=None):
+    """Final conductivity calculation, the best way to do this is averaging the last so many k values. With
+    k_blocking, the blocking.Blocking of the k series, its error of the mean goes to k_err.txt"""
     # heat_flux - [# walkers]/([time][length]**2)
     # dT(x)/dx - [# walkers]/[length]
     # k - 1/([time][length])
     k_conv_error_buffer = int(k_conv_error_buffer)
     k_mean = np.mean(k_list[-k_conv_error_buffer:])
-    k_std = np.std(k_list[-k_conv_error_buffer:], ddof=1)
     dt_dx_mean = np.mean(dt_dx_list[-k_conv_error_buffer:])
-    dt_dx_std = np.std(dt_dx_list[-k_conv_error_buffer:], ddof=1)
+    if len(k_list[-k_conv_error_buffer:]) > 1:
+        k_std = np.std(k_list[-k_conv_error_buffer:], ddof=1)
+        dt_dx_std = np.std(dt_dx_list[-k_conv_error_buffer:], ddof=1)
+    else:  # single value, e.g. the steady state solver
+        k_std = 0.0
+        dt_dx_std = 0.0
     logging.info("Average dT(x)/dx: %.4E +/- %.4E" % (dt_dx_mean, dt_dx_std))
     logging.info("Conductivity: %.4E +/- %.4E" % (k_mean, k_std))
+    if k_blocking is not None and not k_blocking.level_errors():
+        logging.info("Too few k values past begin_cov_check for a blocking error")
+    elif k_blocking is not None:
+        k_block_err, k_tau, plateau = k_blocking.error()
+        logging.info("Blocking: k %.4E +/- %.4E, integrated autocorrelation time %.2f analyses%s"
+                     % (k_blocking.mean(), k_block_err, k_tau, '' if plateau else ', no plateau, a lower bound'))
+        f = open("%s/k_err.txt" % cur_dir, 'w')
+        f.write("%.4E\n" % k_block_err)
+        f.close()
 
     f = open("%s/k.txt" % cur_dir, 'w')
     f.write("%.4E\n" % k_mean)
@@ -40,6 +56,25 @@ def final_conductivity_onlat(cur_dir, prob_m_cn, dt_dx_list, k_list, k_conv_erro
     f.close()
 
 
+def k_converged(k_list, cur_num_walkers, begin_cov_check, k_conv_error_buffer, k_convergence_tolerance,
+                k_blocking=None, k_error_target=None):
+    """True once more than begin_cov_check walkers are in and the std. dev. of the last k_conv_error_buffer k values,
+    the error final_conductivity_onlat reports, has dropped below k_convergence_tolerance. Or, with k_error_target,
+    once the blocking error of the mean k in k_blocking has reached a plateau below it"""
+    k_conv_error_buffer = int(k_conv_error_buffer)
+    if cur_num_walkers <= begin_cov_check:
+        return False
+    if k_blocking is not None and k_error_target:
+        k_block_err, k_tau, plateau = k_blocking.error()
+        if plateau and k_block_err < k_error_target:
+            return True
+    if not k_convergence_tolerance:
+        return False
+    if len(k_list) < max(k_conv_error_buffer, 2):  # a full window, so a couple of close values don't stop the run
+        return False
+    return np.std(k_list[-k_conv_error_buffer:], ddof=1) < k_convergence_tolerance
+
+
 def check_convergence_2d_onlat(H_tot, cur_num_walkers, grid_size, timesteps):
     temp_profile = H_tot
     # k is very sensitive to this, 0.03 works good
@@ -59,10 +94,7 @@ def check_convergence_2d_onlat(H_tot, cur_num_walkers, grid_size, timesteps):
 
 def check_convergence_3d_onlat(H_tot, cur_num_walkers, grid_size, timesteps):
     temp_profile = H_tot  # temp_profile is 3D. Collapse y and z dimensions (periodic)
-    temp_profile_sum = np.zeros((len(temp_profile), len(temp_profile)))
-    for i in range(len(temp_profile)):
-        for j in range(len(temp_profile)):
-            temp_profile_sum[i][j] = np.sum(temp_profile[i][j])
+    temp_profile_sum = np.sum(temp_profile, axis=2, dtype=float)
     # k is very sensitive to this, 0.03 works good
     # DO NOT CHANGE WITHOUT BEST CALIBRATING VALUE TO MATCH k=0.00333 for an empty box first
     cutoff_dist = int(0.03 * grid_size)
@@ -78,6 +110,121 @@ def check_convergence_3d_onlat(H_tot, cur_num_walkers, grid_size, timesteps):
     return slope, heat_flux, gradient_err, k, k_err, r_value ** 2, temp_profile_sum
 
 
+class ProfileFit(object):
+    """check_convergence_2d/3d_onlat kept up to date as endpoint deltas arrive. Holds the histogram collapsed over z
+    and the sums and sums of squares of its rows, so a fit costs O(grid_size) instead of a pass over the whole
+    histogram. The rows are integer counts, so the sums stay exact"""
+    def __init__(self, grid_size, dim, H=None):
+        self.grid_size = grid_size
+        self.dim = dim
+        self.reset(H)
+
+    def reset(self, H=None):
+        """Starts over from histogram H, e.g. a restored or fully reduced one. In 3D, H may be collapsed over z
+        already"""
+        n = self.grid_size + 1
+        if H is None:
+            self.profile = np.zeros((n, n), dtype=np.int64)
+        elif np.ndim(H) == 3:
+            self.profile = np.sum(H, axis=2, dtype=np.int64)  # collapse z
+        else:
+            self.profile = np.array(H, dtype=np.int64)
+        self.row_sum = np.sum(self.profile, axis=1)
+        self.row_sq = np.sum(self.profile ** 2, axis=1)
+
+    def add_deltas(self, deltas):
+        """Histograms transitions.endpoint_deltas, updating the rows they land in only"""
+        deltas = np.asarray(deltas)
+        if len(deltas) == 0:
+            return
+        n = self.grid_size + 1
+        cells = np.abs(deltas) - 1
+        if self.dim == 3:
+            cells = cells // n  # raveled (x, y, z) to raveled (x, y)
+        cells, inverse = np.unique(cells, return_inverse=True)
+        change = np.zeros(len(cells), dtype=np.int64)
+        np.add.at(change, inverse.reshape(-1), np.sign(deltas))
+        flat = self.profile.reshape(-1)
+        old = flat[cells]
+        rows = cells // n
+        np.add.at(self.row_sum, rows, change)
+        np.add.at(self.row_sq, rows, change * (2 * old + change))  # (old + change) ** 2 - old ** 2
+        flat[cells] = old + change
+
+    def fit(self, cur_num_walkers, timesteps):
+        """Same results as check_convergence_2d/3d_onlat on the full histogram, the profile they fit is profile"""
+        n = self.grid_size + 1
+        cutoff_dist = int(0.03 * self.grid_size)  # see check_convergence_2d_onlat
+        row_sum = self.row_sum[cutoff_dist:self.grid_size - cutoff_dist]
+        row_sq = self.row_sq[cutoff_dist:self.grid_size - cutoff_dist]
+        test_mean = row_sum / n
+        test_std = np.sqrt((n * row_sq - row_sum ** 2) / (n * (n - 1.0)))  # ddof=1
+        heat_flux = float(cur_num_walkers) / (float(n) ** (self.dim - 1) * float(timesteps))
+        gradient_err = np.mean(test_std)
+        # least squares line through the row means, as stats.linregress
+        x = np.arange(cutoff_dist, self.grid_size - cutoff_dist)
+        x_dev = x - np.mean(x)
+        mean_dev = test_mean - np.mean(test_mean)
+        ss_x = np.dot(x_dev, x_dev)
+        ss_mean = np.dot(mean_dev, mean_dev)
+        ss_x_mean = np.dot(x_dev, mean_dev)
+        slope = ss_x_mean / ss_x  # slope is dT(x)/dx
+        r2 = ss_x_mean ** 2 / (ss_x * ss_mean) if ss_mean > 0 else 0.0
+        k = - heat_flux / slope
+        k_err = (heat_flux / slope ** 2) * gradient_err
+        return slope, heat_flux, gradient_err, k, k_err, r2
+
+
+class KSeries(object):
+    """k, dT(x)/dx and heat flux of every analysis of a constant flux run, the timestep it was at and the walkers in
+    by then, with the blocking.Blocking of the k values past begin_cov_check and the checks of k_converged. Without
+    blocked, as for the deterministic engines, there is no blocking error"""
+    def __init__(self, begin_cov_check, k_conv_error_buffer, k_convergence_tolerance=None, k_error_target=None,
+                 blocked=True):
+        self.begin_cov_check = begin_cov_check
+        self.k_conv_error_buffer = k_conv_error_buffer
+        self.k_convergence_tolerance = k_convergence_tolerance
+        self.k_error_target = k_error_target
+        self.k_list = []
+        self.dt_dx_list = []
+        self.heat_flux_list = []
+        self.timestep_list = []  # x axis for plots
+        self.walkers_list = []
+        self.k_blocking = blocking.Blocking() if blocked else None
+
+    def restore(self, checkpoint):
+        """Series of a backend.load_checkpoint. Checkpoints from before walkers_list was saved don't say which k
+        values were past begin_cov_check, those are left out of the blocking"""
+        self.k_list = list(checkpoint['k_list'])
+        self.dt_dx_list = list(checkpoint['dt_dx_list'])
+        self.heat_flux_list = list(checkpoint['heat_flux_list'])
+        self.timestep_list = list(checkpoint['timestep_list'])
+        if 'walkers_list' in checkpoint:
+            self.walkers_list = list(checkpoint['walkers_list'])
+        else:
+            if self.k_blocking is not None:
+                logging.warning('Checkpoint has no walker counts, its k values are left out of the blocking error')
+            self.walkers_list = [0] * len(self.k_list)
+        if self.k_blocking is not None:
+            for k, num_walkers in zip(self.k_list, self.walkers_list):
+                if num_walkers > self.begin_cov_check:
+                    self.k_blocking.add(k)
+
+    def add(self, k, dt_dx, heat_flux, timestep, cur_num_walkers):
+        self.k_list.append(k)
+        if self.k_blocking is not None and cur_num_walkers > self.begin_cov_check:
+            self.k_blocking.add(k)
+        self.dt_dx_list.append(dt_dx)
+        self.heat_flux_list.append(heat_flux)
+        self.timestep_list.append(timestep)
+        self.walkers_list.append(cur_num_walkers)
+
+    def converged(self, cur_num_walkers):
+        """k_converged of the series with cur_num_walkers walkers in"""
+        return k_converged(self.k_list, cur_num_walkers, self.begin_cov_check, self.k_conv_error_buffer,
+                           self.k_convergence_tolerance, self.k_blocking, self.k_error_target)
+
+
 def rules_test_analysis(H_tot, cur_num_walkers, tot_time):
     """As this is the rules test, temperature is times visited by walkers. Works for 2D and 3D."""
     temp_profile = H_tot
@@ -15,6 +15,7 @@ from __future__ import division
 import numpy as np
 import os
 import glob
+import pickle
 
 
 def check_for_folder(folder):
@@ -39,6 +40,51 @@ def get_plot_save_dir(folder, num_tubes, orientation, tube_length, restart=False
     return plot_save_dir
 
 
+def get_ensemble_save_dirs(folder, members, orientation, tube_length, restart=False):
+    """get_plot_save_dir for every (num_tubes, config) member of an ensemble. Folders are made one after the other, so
+    the configs of a num_tubes get consecutive numbers. On restart these are the newest folders of every num_tubes"""
+    if not restart:
+        return [get_plot_save_dir(folder, num_tubes, orientation, tube_length) for num_tubes, config in members]
+    num_configs = {}
+    for num_tubes, config in members:
+        num_configs[num_tubes] = num_configs.get(num_tubes, 0) + 1
+    newest = {}
+    for num_tubes in num_configs:
+        newest[num_tubes] = int(get_plot_save_dir(folder, num_tubes, orientation, tube_length, True).split('_')[3])
+    return ["%d_%s_%d_%d" % (num_tubes, orientation, tube_length,
+                             newest[num_tubes] - num_configs[num_tubes] + 1 + config) for num_tubes, config in members]
+
+
+def save_grid(folder, grid):
+    """Grid of the run, loaded again on restart"""
+    with open('%s/grid.pkl' % folder, 'wb') as f:
+        pickle.dump(grid, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_grid(folder):
+    with open('%s/grid.pkl' % folder, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_checkpoint(folder, H, series, done_slots, run_state, profile=None):
+    """Walk state after the first done_slots slots, with the analysis.KSeries series and the 3D profile collapsed over z
+    if H is binned. Written to a temporary file first, a job killed while writing keeps the previous checkpoint"""
+    temp_file = '%s/checkpoint_tmp.npz' % folder
+    if profile is not None:
+        run_state = dict(run_state, profile=profile)
+    np.savez(temp_file, H=H, k_list=series.k_list, dt_dx_list=series.dt_dx_list, heat_flux_list=series.heat_flux_list,
+             timestep_list=series.timestep_list, walkers_list=series.walkers_list, done_slots=done_slots, **run_state)
+    os.replace(temp_file, '%s/checkpoint.npz' % folder)
+
+
+def load_checkpoint(folder):
+    """dict of the checkpoint in folder, None if there is none"""
+    if not os.path.exists('%s/checkpoint.npz' % folder):
+        return None
+    with np.load('%s/checkpoint.npz' % folder) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
 def save_fill_frac(folder, fill_fract):
     f = open('%s/fill_fract.txt' % folder, 'w')
     f.write("%.4E\n" % fill_fract)
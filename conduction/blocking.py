@@ -0,0 +1,91 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""blocking.py
+CONDUCTION package
+
+Error of the mean of a correlated series, e.g. the k values of a constant flux run, by Flyvbjerg-Petersen blocking.
+Neighbouring values are averaged pairwise over and over, at every level the blocks are less correlated, and the naive
+standard error of the blocks grows until it levels off at the true error of the mean. The integrated autocorrelation
+time follows from how much it grew. Values are added one at a time and only running sums are kept per level."""
+
+from __future__ import division
+import numpy as np
+
+
+class Blocking(object):
+    """Streaming blocking analysis. Level l holds the averages of 2**l consecutive values as a count, sum and sum of
+    squares, plus the first half of its next block, so adding a value is O(log n) and the series is not stored.
+    Levels with fewer than min_blocks blocks are too noisy to use"""
+    def __init__(self, min_blocks=8):
+        self.min_blocks = min_blocks
+        self.count = []
+        self.total = []
+        self.total_sq = []
+        self.pending = []  # first value of the next block of each level, None if there is none
+
+    def add(self, value):
+        """Adds the next value of the series"""
+        level = 0
+        while True:
+            if level == len(self.count):
+                self.count.append(0)
+                self.total.append(0.0)
+                self.total_sq.append(0.0)
+                self.pending.append(None)
+            self.count[level] += 1
+            self.total[level] += value
+            self.total_sq[level] += value * value
+            if self.pending[level] is None:
+                self.pending[level] = value
+                return
+            value = 0.5 * (self.pending[level] + value)  # block of the next level
+            self.pending[level] = None
+            level += 1
+
+    def mean(self):
+        """Mean of the values added so far"""
+        if not self.count:
+            return np.nan
+        return self.total[0] / self.count[0]
+
+    def level_errors(self):
+        """Naive standard error of the mean at every level with at least min_blocks blocks, and the error of that
+        estimate"""
+        errors = []
+        for count, total, total_sq in zip(self.count, self.total, self.total_sq):
+            if count < max(self.min_blocks, 2):
+                break
+            variance = max(total_sq / count - (total / count) ** 2, 0.0)
+            error = np.sqrt(variance / (count - 1))
+            errors.append((error, error / np.sqrt(2.0 * (count - 1))))
+        return errors
+
+    def error(self):
+        """Error of the mean, the integrated autocorrelation time in values (0.5 if uncorrelated) and whether the
+        errors reached a plateau. That is the first level no later level exceeds by more than its own error. Without
+        a plateau the error of the last usable level is returned, a lower bound"""
+        errors = self.level_errors()
+        if not errors:
+            return np.nan, np.nan, False
+        plateau = False
+        level = len(errors) - 1
+        for l in range(len(errors) - 1):
+            if all(error <= errors[l][0] + errors[l][1] for error, error_err in errors[l + 1:]):
+                plateau = True
+                level = l
+                break
+        error = errors[level][0]
+        tau = 0.5 * (error / errors[0][0]) ** 2 if errors[0][0] > 0 else np.nan
+        return error, tau, plateau
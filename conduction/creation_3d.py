@@ -18,9 +18,11 @@ import logging
 import math
 
 from conduction import backend
+from conduction import creation_onlat
+from conduction import transitions
 
 
-class Grid3D_onlat(object):
+class Grid3D_onlat(creation_onlat.Grid_onlat):
     def __init__(self, grid_size, tube_length, num_tubes, orientation, tube_radius, parallel, plot_save_dir,
                  disable_func, rules_test, inert_vol, rank=None, size=None):
         """Grid in first quadrant only for convenience"""
@@ -47,7 +49,8 @@ class Grid3D_onlat(object):
             logging.info("Zero tube radius given. Tubes will have no volume.")
             fill_fract = 2.0 * float(num_tubes) / grid_size ** 3
             logging.info("Filling fraction is %.2f %%" % (fill_fract * 100.0))
-            backend.save_fill_frac(plot_save_dir, fill_fract)
+            if not rank:  # grids regenerated on every core write once
+                backend.save_fill_frac(plot_save_dir, fill_fract)
             if num_tubes > 0:  # tubes exist
                 for i in range(num_tubes):  # currently no mean dist used, ADD LATER?
                     if (i % 50) == 0:
@@ -155,10 +158,14 @@ class Grid3D_onlat(object):
             fill_fract = float(cube_count) * 2.0 * tube_radius / grid_size ** 3
             # each cube has area 1, times the tube radius (important if not 1)
             logging.info("Filling fraction is %.2f %%" % (fill_fract * 100.0))
-            backend.save_fill_frac(plot_save_dir, fill_fract)
+            if not rank:  # grids regenerated on every core write once
+                backend.save_fill_frac(plot_save_dir, fill_fract)
             self.tube_check_l, self.tube_check_r, self.tube_check_bd = self.generate_tube_check_array_3d(rules_test)
             self.tube_check_bd_vol, self.tube_check_index = self.generate_vol_check_array_3d(disable_func, inert_vol)
+            self.tube_squares_flat, self.tube_squares_offsets, self.tube_squares_len = \
+                self.generate_tube_squares_csr()
         # self.calc_p_cn_m_3d()
+        self.bd_index, self.bd_neighbors, self.bd_num_neighbors = self.generate_bd_neighbors_3d()
         self.avg_tube_len, self.std_tube_len, self.tube_lengths = self.check_tube_lengths()
         logging.info("Actual tube length avg+std: %.4f +- %.4f" % (self.avg_tube_len, self.std_tube_len))
 
@@ -540,10 +547,34 @@ class Grid3D_onlat(object):
             dist = self.euc_dist(self.tube_coords[i][0], self.tube_coords[i][1], self.tube_coords[i][2],
                                  self.tube_coords[i][3], self.tube_coords[i][4], self.tube_coords[i][5])
             tube_lengths[i] = dist
+        if len(tube_lengths) == 0:  # empty box, as used to calibrate k
+            return 0.0, 0.0, tube_lengths
         avg_tube_len = np.mean(tube_lengths)
         std_tube_len = np.std(tube_lengths, ddof=1)
         return avg_tube_len, std_tube_len, tube_lengths
 
+    def generate_bd_neighbors_3d(self):
+        """Neighbor table of the boundary cubes with the reflective/periodic bound already applied.
+        Boundary cube (x, y, z) has row bd_index[x, y, z] - 1, it steps to one of the first bd_num_neighbors[row]
+        cubes of bd_neighbors[row]. Moves through a reflective wall are removed."""
+        moves_3d = np.asarray([[0, 0, 1], [0, 1, 0], [1, 0, 0], [0, 0, -1], [0, -1, 0], [-1, 0, 0]])
+        bd_pos = np.argwhere(self.tube_check_bd == -1000)
+        bd_index = np.zeros((self.size + 1, self.size + 1, self.size + 1), dtype=int)
+        bd_index[bd_pos[:, 0], bd_pos[:, 1], bd_pos[:, 2]] = np.arange(len(bd_pos)) + 1  # THESE ARE OFFSET BY ONE
+        choices = bd_pos[:, None, :] + moves_3d[None, :, :]
+        valid = np.ones(choices.shape[:2], dtype=bool)
+        max_val = self.size  # not + 1 as in setup as we can walk on 0 or 100
+        for j in range(len(self.bound)):
+            if self.bound[j] == 10:  # reflective
+                valid &= (choices[:, :, j] >= 0) & (choices[:, :, j] <= max_val)
+            elif self.bound[j] == 20:  # periodic
+                choices[:, :, j] = choices[:, :, j] % max_val
+        # move the remaining choices to the front
+        order = np.argsort(~valid, axis=1, kind='stable')
+        choices = choices[np.arange(len(bd_pos))[:, None], order]
+        num_choices = np.sum(valid, axis=1)
+        return bd_index, choices, num_choices
+
     @staticmethod
     def check_tube_unique(coords_list, parallel, rank=None, size=None):
         uni_flag = None
@@ -667,30 +698,16 @@ class Grid3D_onlat(object):
         return dist
 
 
-class Walker3D_onlat(object):
-    def __init__(self, grid_size, temp, rules_test):
-        if not rules_test:
-            if temp == 'hot':
-                start_x = 0
-            elif temp == 'cold':
-                start_x = grid_size
-            else:
-                logging.error('Invalid walker temperature')
-                raise SystemExit
-        else:
-            start_x = np.random.randint(0, grid_size + 1)
-        start_y = np.random.randint(0, grid_size + 1)
-        start_z = np.random.randint(0, grid_size + 1)
-        start = [start_x, start_y, start_z]
-        self.pos = [start]
-
-    def add_pos(self, newpos):  # add new position
-        self.pos.append(list(newpos))
-
-    def replace_pos(self, newpos):  # replace current position
-        self.pos[-1] = list(newpos)
-
-    def erase_prev_pos(self):
-        '''Removes all but last position from memory. Important for constant flux simulation
-        so that memory usage is kept low.'''
-        self.pos = [self.pos[-1]]  # double nesting is important here for the way the item is parsed
+class Walker3D_onlat(creation_onlat.Walker_onlat):
+    __slots__ = ()
+
+    def __init__(self, grid_size, temp, rules_test, rng=np.random, record_steps=None, start=None):
+        """3D walker, start is its square on the wall (y, z)"""
+        super(Walker3D_onlat, self).__init__(grid_size, 3, temp, rules_test, rng, record_steps, start)
+
+
+class Population3D_onlat(transitions.Population_onlat):
+    def __init__(self, grid_size, rules_test, rng=np.random):
+        """Population of 3D walkers, advanced all at once by rules_onlat.apply_moves_onlat_vec.
+        Same start rules as Walker3D_onlat."""
+        super(Population3D_onlat, self).__init__(grid_size, 3, rules_test, rng)
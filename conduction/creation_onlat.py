@@ -0,0 +1,120 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""creation_onlat.py
+CONDUCTION package
+
+The parts of the on lattice grids and walkers that do not depend on the dimension. Grid2D_onlat/Grid3D_onlat build
+their tubes and boundaries, Grid_onlat keeps the tube squares in CSR arrays, handles pickling and compiles the
+transition table. Walker2D_onlat/Walker3D_onlat are Walker_onlat of a fixed dimension."""
+
+from __future__ import division
+import numpy as np
+import logging
+
+from conduction import transitions
+
+
+class Grid_onlat(object):
+    """Base of Grid2D_onlat and Grid3D_onlat"""
+    def generate_tube_squares_csr(self):
+        """Squares of every tube in one contiguous array, tube i is flat[offsets[i]:offsets[i + 1]]"""
+        dim = len(self.bound)
+        tube_len = np.asarray([len(squares) for squares in self.tube_squares], dtype=int)
+        offsets = np.zeros(len(tube_len) + 1, dtype=int)
+        offsets[1:] = np.cumsum(tube_len)
+        flat = np.zeros((offsets[-1], dim), dtype=int)
+        for i in range(len(self.tube_squares)):
+            flat[offsets[i]:offsets[i + 1]] = self.tube_squares[i]
+        return flat, offsets, tube_len
+
+    def random_tube_squares(self, tube_idx, rng=np.random):
+        """Uniform random volume/endpoint square within tube tube_idx, or within each tube of an array of them"""
+        tube_idx = np.asarray(tube_idx, dtype=int)
+        pick = self.tube_squares_offsets[tube_idx] \
+            + (rng.random(tube_idx.shape) * self.tube_squares_len[tube_idx]).astype(int)
+        return self.tube_squares_flat[pick]
+
+    def __getstate__(self):
+        """The ragged tube_squares lists are rebuilt from the CSR arrays, so they are not pickled/broadcast.
+        Shared memory windows/blocks belong to the processes of one node and are not pickled either"""
+        state = self.__dict__.copy()
+        if 'tube_squares_flat' in state:
+            del state['tube_squares']
+        state.pop('shared_windows', None)
+        state.pop('shared_blocks', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'tube_squares_flat' in state:
+            self.tube_squares = np.split(self.tube_squares_flat, self.tube_squares_offsets[1:-1])
+
+    def compile_transitions(self, kapitza, prob_m_cn):
+        """Resolve the walk rules once for every square and move choice, used by the vectorized engines"""
+        self.transitions = transitions.TransitionTable(self, kapitza, prob_m_cn)
+        return self.transitions
+
+
+class Walker_onlat(object):
+    __slots__ = ('cur_pos', 'trajectory', 'num_pos')
+
+    def __init__(self, grid_size, dim, temp, rules_test, rng=np.random, record_steps=None, start=None):
+        """Only the current position is kept. With record_steps the trajectory of up to that many steps is
+        also written to a preallocated array, for path plots and rules tests. start is the square on the wall
+        (y(, z)), drawn if not given"""
+        if not rules_test:
+            if temp == 'hot':
+                start_x = 0
+            elif temp == 'cold':
+                start_x = grid_size
+            else:
+                logging.error('Invalid walker temperature')
+                raise SystemExit
+        else:
+            start_x = rng.randint(0, grid_size + 1)
+        if start is None or rules_test:
+            start = [rng.randint(0, grid_size + 1) for j in range(1, dim)]
+        self.cur_pos = np.asarray([start_x] + list(start), dtype=int)
+        if record_steps is None:
+            self.trajectory = None
+        else:
+            self.trajectory = np.zeros((record_steps + 1, dim), dtype=int)
+            self.trajectory[0] = self.cur_pos
+        self.num_pos = 1  # positions visited so far
+
+    @property
+    def pos(self):
+        """Recorded positions, just the current one if the trajectory is not recorded"""
+        if self.trajectory is None:
+            return self.cur_pos[None, :]
+        return self.trajectory[:self.num_pos]
+
+    def add_pos(self, newpos):  # add new position
+        self.cur_pos[:] = newpos  # copy, newpos may be a view into the grid
+        if self.trajectory is not None:
+            self.trajectory[self.num_pos] = newpos
+        self.num_pos += 1
+
+    def replace_pos(self, newpos):  # replace current position
+        self.cur_pos[:] = newpos
+        if self.trajectory is not None:
+            self.trajectory[self.num_pos - 1] = newpos
+
+    def erase_prev_pos(self):
+        '''Removes all but last position from memory. Important for constant flux simulation
+        so that memory usage is kept low.'''
+        if self.trajectory is not None:
+            self.trajectory[0] = self.cur_pos
+        self.num_pos = 1
@@ -0,0 +1,191 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""master_equation.py
+CONDUCTION package
+
+Deterministic counterpart of the constant flux random walk. The walk rules in rules_2d/rules_3d only depend on
+the square a walker is on, so the probability to find a walker on each square evolves by a fixed one-step
+transition matrix P. Evolving the hot and cold source distributions with P gives the expected histogram
+(the exact temperature profile) without any walkers."""
+
+from __future__ import division
+import logging
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.sparse import linalg as spla
+
+from conduction import analysis
+from conduction import transitions
+
+
+def build_transition_matrix(grid, kapitza, prob_m_cn):
+    """Sparse one-step transition matrix P, P[i, j] is the probability to step from square j to square i"""
+    dim = len(grid.bound)
+    num = (grid.size + 1) ** dim
+    table = transitions.compiled(grid, kapitza, prob_m_cn)
+    num_choices = table.num_choices
+    dest_a = table.dest_a
+    dest_b = table.dest_b
+    prob_a = table.prob_a()
+    src = []
+    dst = []
+    data = []
+    for choice in range(dest_a.shape[1]):
+        used = (choice < num_choices)
+        weight = np.zeros(num)
+        weight[used] = 1.0 / num_choices[used]
+        for dest, p in [(dest_a[:, choice], prob_a[:, choice]), (dest_b[:, choice], 1.0 - prob_a[:, choice])]:
+            w = weight * p
+            mask = (w > 0) & (dest >= 0)
+            src.append(np.nonzero(mask)[0])
+            dst.append(dest[mask])
+            data.append(w[mask])
+            # uniform over every square of the tube
+            mask = (w > 0) & (dest < 0)
+            for j in np.nonzero(mask)[0]:
+                squares = table.squares_of_tube(-dest[j] - 1)
+                src.append(np.zeros(len(squares), dtype=int) + j)
+                dst.append(squares)
+                data.append(np.zeros(len(squares)) + w[j] / len(squares))
+    P = sparse.csr_matrix((np.concatenate(data), (np.concatenate(dst), np.concatenate(src))), shape=(num, num))
+    return P
+
+
+def source_distributions(grid):
+    """Start distributions of hot (x = 0) and cold (x = grid.size) walkers, uniform over the wall"""
+    dim = len(grid.bound)
+    shape = (grid.size + 1,) * dim
+    hot = np.zeros(shape)
+    cold = np.zeros(shape)
+    hot[0] = 1.0 / (grid.size + 1) ** (dim - 1)
+    cold[grid.size] = 1.0 / (grid.size + 1) ** (dim - 1)
+    return hot.ravel(), cold.ravel()
+
+
+def constant_flux(grid, kapitza, prob_m_cn, inject_times, tot_walkers, tot_time, printout_inc):
+    """Expected histogram of the live constant flux simulation. Every timestep H = P H, then the pairs injected
+    at that timestep add hot - cold. Every printout_inc timesteps the exact profile is analysed like H_master."""
+    dim = len(grid.bound)
+    shape = (grid.size + 1,) * dim
+    logging.info('Building %dD transition matrix' % dim)
+    P = build_transition_matrix(grid, kapitza, prob_m_cn)
+    logging.info('Transition matrix has %d squares and %d nonzero entries' % (P.shape[0], P.nnz))
+    hot, cold = source_distributions(grid)
+    source = hot - cold
+    inject = np.bincount(inject_times, minlength=tot_time)
+    inject_total = np.cumsum(inject)
+    H = np.zeros(P.shape[0])
+    k_list = []
+    dt_dx_list = []
+    heat_flux_list = []
+    timestep_list = []
+    for cur_time in range(tot_time):
+        H = P.dot(H)
+        if inject[cur_time] > 0:
+            H += inject[cur_time] * source
+        if ((cur_time + 1) % printout_inc != 0) and (cur_time != tot_time - 1):
+            continue
+        if dim == 2:
+            dt_dx, heat_flux, dt_dx_err, k, k_err, r2 = analysis.check_convergence_2d_onlat(
+                H.reshape(shape), tot_walkers, grid.size, tot_time)
+        else:
+            dt_dx, heat_flux, dt_dx_err, k, k_err, r2, temp_profile_sum = analysis.check_convergence_3d_onlat(
+                H.reshape(shape), tot_walkers, grid.size, tot_time)
+        k_list.append(k)
+        dt_dx_list.append(dt_dx)
+        heat_flux_list.append(heat_flux)
+        timestep_list.append(cur_time + 1)
+        logging.info("Timestep %d out of %d, %d walkers, R2: %.4f, k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E"
+                     % (cur_time + 1, tot_time, 2 * inject_total[cur_time], r2, k, heat_flux, dt_dx))
+    return H.reshape(shape), k_list, dt_dx_list, heat_flux_list, timestep_list
+
+
+def reachable_squares(P, grid):
+    """Squares a walker can ever be on, starting from any hot or cold wall square"""
+    hot, cold = source_distributions(grid)
+    num = P.shape[0]
+    # extra node num steps onto every wall square, graph[j, i] is the step j -> i
+    sources = sparse.csr_matrix(((hot + cold) > 0).astype(float)[None, :])
+    graph = sparse.bmat([[P.T, sparse.csr_matrix((num, 1))], [sources, None]], format='csr')
+    reached = np.zeros(num + 1, dtype=bool)
+    reached[csgraph.breadth_first_order(graph, num, return_predecessors=False)] = True
+    return reached[:num]
+
+
+def _solve(A, b, method):
+    if method == 'direct':
+        return spla.spsolve(A.tocsc(), b)
+    elif method == 'iterative':
+        ilu = spla.spilu(A.tocsc(), drop_tol=1e-5, fill_factor=20)
+        precond = spla.LinearOperator(A.shape, ilu.solve)
+        x, info = spla.bicgstab(A, b, M=precond, maxiter=10000)
+        if info != 0:
+            logging.error('Iterative steady state solver did not converge (info %d)' % info)
+            raise SystemExit
+        return x
+    else:
+        logging.error('Invalid steady state solver method')
+        raise SystemExit
+
+
+def steady_state(grid, kapitza, prob_m_cn, tot_walkers, tot_time, method='direct'):
+    """Steady state histogram of the constant flux simulation, solved directly.
+    With tot_walkers / 2 pairs injected over tot_time timesteps the long time limit of H = P H + rate (hot - cold)
+    solves (I - P) H = rate (hot - cold). I - P is singular (H + c * stationary is also a solution), so the system
+    is solved with H = 0 on the middle hot wall square and the stationary part is then removed with sum(H) = 0,
+    as the same number of hot and cold walkers are in the box.
+    method is 'direct' (sparse LU) or 'iterative' (ILU preconditioned BiCGSTAB, for large 3D grids)."""
+    dim = len(grid.bound)
+    shape = (grid.size + 1,) * dim
+    P = build_transition_matrix(grid, kapitza, prob_m_cn)
+    logging.info('Transition matrix has %d squares and %d nonzero entries' % (P.shape[0], P.nnz))
+    hot, cold = source_distributions(grid)
+    rate = tot_walkers / (2.0 * tot_time)  # pairs per timestep
+    # squares that can never be reached (closed off pockets) would make I - P singular
+    reached = reachable_squares(P, grid)
+    logging.info('%d of %d squares are reachable from the walls' % (np.sum(reached), P.shape[0]))
+    idx = np.nonzero(reached)[0]
+    A = (sparse.identity(len(idx), format='csr') - P[idx][:, idx]).tocsr()
+    b = rate * (hot - cold)[idx]
+    hot_squares = np.nonzero(hot[idx])[0]
+    ref = hot_squares[len(hot_squares) // 2]
+    keep = np.arange(len(idx)) != ref
+    A_red = A[keep][:, keep]
+    H_red = np.zeros(len(idx))
+    H_red[keep] = _solve(A_red, b[keep], method)
+    # stationary distribution, equal to 1 on the reference square
+    stationary = np.ones(len(idx))
+    stationary[keep] = _solve(A_red, -A[keep][:, ref].toarray().ravel(), method)
+    H_red -= np.sum(H_red) / np.sum(stationary) * stationary
+    H = np.zeros(P.shape[0])
+    H[idx] = H_red
+    residual = np.max(np.abs(A.dot(H_red) - b))
+    logging.info('Steady state residual: %.4E' % residual)
+    return H.reshape(shape)
+
+
+def steady_state_conductivity(grid, kapitza, prob_m_cn, tot_walkers, tot_time, method='direct'):
+    """k of the steady state profile, same definition as the walks (analysis.check_convergence_*_onlat)"""
+    dim = len(grid.bound)
+    H = steady_state(grid, kapitza, prob_m_cn, tot_walkers, tot_time, method)
+    if dim == 2:
+        dt_dx, heat_flux, dt_dx_err, k, k_err, r2 = analysis.check_convergence_2d_onlat(H, tot_walkers, grid.size,
+                                                                                       tot_time)
+    else:
+        dt_dx, heat_flux, dt_dx_err, k, k_err, r2, temp_profile_sum = analysis.check_convergence_3d_onlat(
+            H, tot_walkers, grid.size, tot_time)
+    logging.info("Steady state R2: %.4f, k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E" % (r2, k, heat_flux, dt_dx))
+    return H, k, dt_dx, heat_flux
@@ -19,10 +19,11 @@ from mpi4py import MPI
 import ast
 
 from conduction import backend
+from conduction import random_streams
 from conduction import test_3d
 from conduction import test_2d
-from conduction import randomwalk_3d
-from conduction import randomwalk_2d
+from conduction import randomwalk_onlat
+from conduction import pool_backend
 
 def logging_setup(save_dir):
     backend.check_for_folder(save_dir)
@@ -44,7 +45,7 @@ def save_walker_loc(walker, save_dir, walker_index, temp):
     f = open("%s/%s_walker_%d_traj.txt" % (save_dir, temp, walker_index + 1), "w")
     f.write(header)
     for i in range(len(walker.pos)):
-        f.write(str(i) + " " + str(walker.pos[i]) + "\n")
+        f.write(str(i) + " " + str(walker.pos[i].tolist()) + "\n")
     f.close()
 
 
@@ -68,8 +69,13 @@ if __name__ == "__main__":
     parser.add_argument('--timesteps', type=int, default=25000, help='How many steps to run each walker for. '
                                                                      'Should be (grid_size+1)**2 to have even '
                                                                      'temperature distribution.')
-    parser.add_argument('--k_convergence_tolerance', type=float, default=1E-05, help='Simulation runs until '
-                                                                                 'std. dev. of time fluctuations in k drop below this value.')
+    parser.add_argument('--k_convergence_tolerance', type=float, default=0, help='Constant flux runs stop once the '
+                                                                             'std. dev. of time fluctuations in k '
+                                                                             'drops below this value. 0 (default) '
+                                                                             'runs all num_walkers.')
+    parser.add_argument('--k_error_target', type=float, default=0, help='Constant flux runs also stop once the '
+                                                                        'blocking error of the mean k reaches a '
+                                                                        'plateau below this value. 0 to not use it.')
     parser.add_argument('--begin_cov_check', type=int, default=100, help='Start checking for convergence '
                                                                          'after this many walkers.')
     parser.add_argument('--k_conv_error_buffer', type=int, default=25, help='Include the last X values of time '
@@ -85,10 +91,12 @@ if __name__ == "__main__":
                                                                  'tunneling_wo_vol')
     parser.add_argument('--prob_m_cn', type=float, default=0.5, help='Probability a walker will enter the CNT. '
                                                                      'Only used in kapitza models.')
-    parser.add_argument('--restart', type=str, default='False', help='Looks in previous directory for H to extend or '
-                                                                    'restart simulation.')
+    parser.add_argument('--restart', type=str, default='False', help='Resume the last run of this configuration from '
+                                                                    'its checkpoint, or extend a finished one to a '
+                                                                    'larger num_walkers.')
     parser.add_argument('--num_walkers', type=int, default=50000, help='Total walkers to use for simulaton. '
-                                                                      'Only used if convergence is false.')
+                                                                      'Constant flux runs stop before once k has '
+                                                                      'converged.')
     parser.add_argument('--disable_func', type=str, default='False',
                         help='Turn off functionalization of the tube ends.')
     parser.add_argument('--printout_inc', type=int, default=50, help='deltaT increment for printing out conductivity '
@@ -99,6 +107,75 @@ if __name__ == "__main__":
                                                                       'detailed balance. Available with serial'
                                                                       'or MPI options as in the primary '
                                                                       'program.')
+    parser.add_argument('--engine', type=str, default='scalar', help='Random walk engine for constant flux '
+                                                                     'simulations. scalar moves one walker at a '
+                                                                     'time, vectorized moves all walkers of an '
+                                                                     'iteration together with NumPy, live keeps '
+                                                                     'one persistent population per core and '
+                                                                     'injects walker pairs into it, '
+                                                                     'master_equation evolves the exact expected '
+                                                                     'histogram on core 0 without walkers, '
+                                                                     'steady_state solves for its long time '
+                                                                     'limit directly.')
+    parser.add_argument('--steady_state_method', type=str, default='direct', help='Linear solver for the '
+                                                                                  'steady_state engine. direct '
+                                                                                  '(sparse LU) or iterative '
+                                                                                  '(ILU preconditioned BiCGSTAB, '
+                                                                                  'for large 3D grids).')
+
+    parser.add_argument('--seed', type=int, default=None, help='Run seed. Tubes and every walker draw from '
+                                                                'streams keyed by it, so a run (or a single '
+                                                                'walker) can be replayed. Drawn and logged if not '
+                                                                'given.')
+
+    parser.add_argument('--histogram_comm', type=str, default='sparse', help='How the scalar and vectorized '
+                                                                             'engines send H to core 0. sparse '
+                                                                             'gathers only the new walker '
+                                                                             'endpoints, dense reduces the whole '
+                                                                             'grid.')
+    parser.add_argument('--histogram_3d_bin', type=int, default=1, help='3D constant flux runs keep H binned this '
+                                                                        'many cells per side, 0 for none. k only '
+                                                                        'needs H collapsed over z, which is always '
+                                                                        'kept.')
+
+    parser.add_argument('--schedule', type=str, default='static', help='How the scalar and vectorized engines '
+                                                                       'share walkers. static gives core r every '
+                                                                       'size-th injection time, dynamic has core 0 '
+                                                                       'hand out injection times from a queue.')
+
+    parser.add_argument('--starts', type=str, default='random', help='Where constant flux walkers start on the '
+                                                                     'hot and cold walls. random draws each '
+                                                                     'start, stratified covers the wall once every '
+                                                                     'grid_size + 1 pairs, halton follows a '
+                                                                     'low-discrepancy sequence over the pairs.')
+    parser.add_argument('--coupling', type=str, default='independent', help='Random numbers of the hot and cold '
+                                                                             'walker of a pair. independent or common '
+                                                                             '(the cold walker replays the hot '
+                                                                             'one\'s).')
+
+    parser.add_argument('--grid_build', type=str, default='shared', help='How constant flux cores get the grid. '
+                                                                         'shared builds it on core 0 and maps its '
+                                                                         'arrays into node shared memory, '
+                                                                         'regenerate builds it on every core from '
+                                                                         'the run seed and compares hashes.')
+
+    parser.add_argument('--backend', type=str, default='mpi', help='Execution backend for constant flux. mpi uses '
+                                                                   'the MPI cores, pool runs the scalar or '
+                                                                   'vectorized engine on a process pool of one '
+                                                                   'machine without mpirun.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes of the pool backend.')
+
+    parser.add_argument('--threads', type=int, default=1, help='Threads per core for the vectorized engine. The '
+                                                               'slots of a batch are split between them, so one '
+                                                               'core per socket or node can keep every CPU busy.')
+
+    parser.add_argument('--ensemble_num_tubes', type=int, nargs='+', default=None, help='Run a constant flux sweep '
+                                                                                        'over these num_tubes in '
+                                                                                        'one job. The cores are '
+                                                                                        'split evenly between the '
+                                                                                        'members.')
+    parser.add_argument('--ensemble_configs', type=int, default=1, help='Configurations per num_tubes of the '
+                                                                        'ensemble.')
 
     args = parser.parse_args()
 
@@ -119,8 +196,9 @@ if __name__ == "__main__":
     save_dir = args.save_dir
     quiet = args.quiet
     num_tubes = args.num_tubes
-    k_convergence_tolerance = args.k_convergence_tolerance
+    k_convergence_tolerance = args.k_convergence_tolerance or None  # 0 disables early stopping
     begin_cov_check = args.begin_cov_check
+    k_error_target = args.k_error_target
     k_conv_error_buffer = args.k_conv_error_buffer
     save_loc_plots = args.save_loc_plots
     gen_plots = args.gen_plots
@@ -131,10 +209,51 @@ if __name__ == "__main__":
     disable_func = args.disable_func
     rules_test = args.rules_test
     model = args.model
+    engine = args.engine
+    steady_state_method = args.steady_state_method
+    seed = args.seed
+    histogram_comm = args.histogram_comm
+    histogram_3d_bin = args.histogram_3d_bin
+    schedule = args.schedule
+    starts = args.starts
+    coupling = args.coupling
+    grid_build = args.grid_build
+    backend_name = args.backend
+    workers = args.workers
+    threads = args.threads
+    ensemble_num_tubes = args.ensemble_num_tubes
+    ensemble_configs = args.ensemble_configs
 
     os.chdir(save_dir)
 
-    if rank == 0:
+    if ensemble_num_tubes is not None:
+        # one sub-communicator per (num_tubes, config) member, every member runs at once in its usual folder
+        members = [(ensemble_tubes, config) for ensemble_tubes in ensemble_num_tubes
+                   for config in range(ensemble_configs)]
+        if size % len(members) != 0 or rules_test or backend_name != 'mpi':
+            logging.error('Ensembles run constant flux on the mpi backend, with cores a multiple of %d members'
+                          % len(members))
+            raise SystemExit
+        if rank == 0:
+            member_dirs = backend.get_ensemble_save_dirs(save_dir, members, orientation, tube_length, restart)
+        else:
+            member_dirs = None
+        member_dirs = comm.bcast(member_dirs, root=0)
+        member = rank // (size // len(members))
+        comm = comm.Split(member, rank)
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        num_tubes = members[member][0]
+        if seed is not None:
+            seed = random_streams.member_seed(seed, member)
+        if rank == 0:
+            plot_save_dir = member_dirs[member]
+            logging_setup(plot_save_dir)
+            logging.info('Ensemble member %d of %d, %d tubes, configuration %d, %d cores'
+                         % (member + 1, len(members), num_tubes, members[member][1] + 1, size))
+        else:
+            plot_save_dir = None
+    elif rank == 0:
         plot_save_dir = backend.get_plot_save_dir(save_dir, num_tubes, orientation, tube_length, restart)
         logging_setup(plot_save_dir)
     else:
@@ -144,6 +263,14 @@ if __name__ == "__main__":
 
     ##### VALUE & COMMON SENSE CHECKS#####
     possible_dim = [2, 3]
+    possible_engines = ['scalar', 'vectorized', 'live', 'master_equation', 'steady_state']
+    possible_steady_state_methods = ['direct', 'iterative']
+    possible_histogram_comms = ['sparse', 'dense']
+    possible_schedules = ['static', 'dynamic']
+    possible_grid_builds = ['shared', 'regenerate']
+    possible_starts = ['random', 'stratified', 'halton']
+    possible_couplings = ['independent', 'common']
+    possible_backends = ['mpi', 'pool']
     if model == 'kapitza':
         tube_radius = 0.5
         kapitza = True
@@ -179,6 +306,49 @@ if __name__ == "__main__":
     if dim not in possible_dim:
         logging.error('Invalid dimension')
         raise SystemExit
+    if engine not in possible_engines:
+        logging.error('Invalid engine')
+        raise SystemExit
+    if steady_state_method not in possible_steady_state_methods:
+        logging.error('Invalid steady state method')
+        raise SystemExit
+    if histogram_comm not in possible_histogram_comms:
+        logging.error('Invalid histogram communication')
+        raise SystemExit
+    if histogram_3d_bin < 0:
+        logging.error('Invalid 3D histogram bin')
+        raise SystemExit
+    if schedule not in possible_schedules:
+        logging.error('Invalid schedule')
+        raise SystemExit
+    if starts not in possible_starts:
+        logging.error('Invalid walker starts')
+        raise SystemExit
+    if coupling not in possible_couplings:
+        logging.error('Invalid pair coupling')
+        raise SystemExit
+    if grid_build not in possible_grid_builds:
+        logging.error('Invalid grid build')
+        raise SystemExit
+    if backend_name not in possible_backends:
+        logging.error('Invalid backend')
+        raise SystemExit
+    if backend_name == 'pool':
+        if size > 1:
+            logging.error('Pool backend runs on one process, start it without mpirun')
+            raise SystemExit
+        if rules_test or engine not in ['scalar', 'vectorized']:
+            logging.error('Pool backend only runs the scalar and vectorized constant flux engines')
+            raise SystemExit
+        if restart:
+            logging.error('Pool backend does not restart from checkpoints, use the mpi backend')
+            raise SystemExit
+        if workers < 1:
+            logging.error('Invalid number of workers')
+            raise SystemExit
+    if threads < 1:
+        logging.error('Invalid number of threads')
+        raise SystemExit
     if grid_size < 5:
         logging.error('Invalid grid size')
         raise SystemExit
@@ -198,6 +368,9 @@ if __name__ == "__main__":
     if begin_cov_check >= num_walkers:
         logging.warning('begin_cov_check is less than or equal to num_walkers, forcing 3*num_walkers')
         num_walkers *= 3
+    if not rules_test and num_walkers % 2 != 0:
+        logging.warning('Constant flux walkers are injected in hot/cold pairs, using %d walkers' % (num_walkers - 1))
+        num_walkers -= 1
     logging.info('Grid size of %d is being used' % (grid_size + 1))
     if disable_func:
         logging.info('Functionalization has been disabled, treating ends as volume in rules.')
@@ -228,14 +401,22 @@ if __name__ == "__main__":
                                     size, rules_test, restart, inert_vol)
     else:
         logging.info("Starting %dD constant flux on-lattice random walk." % dim)
-        if dim == 2:
-            randomwalk_2d.parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation, timesteps,
-                                          quiet, plot_save_dir, gen_plots, kapitza, prob_m_cn,
-                                          num_walkers, printout_inc, k_conv_error_buffer, disable_func, rank, size,
-                                          rules_test, restart, inert_vol, save_loc_plots)
-        elif dim == 3:
-            randomwalk_3d.parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation, timesteps,
-                                          quiet, plot_save_dir, gen_plots, kapitza, prob_m_cn, num_walkers,
-                                          printout_inc,
-                                          k_conv_error_buffer, disable_func, rank, size, rules_test, restart, inert_vol,
-                                          save_loc_plots)
+        if backend_name == 'pool':
+            pool_backend.parallel_method(dim, grid_size, tube_length, tube_radius, num_tubes, orientation, timesteps,
+                                         quiet, plot_save_dir, gen_plots, kapitza, prob_m_cn, num_walkers,
+                                         printout_inc, k_conv_error_buffer, disable_func, rules_test, inert_vol,
+                                         workers, engine=engine, seed=seed,
+                                         k_convergence_tolerance=k_convergence_tolerance,
+                                         begin_cov_check=begin_cov_check, histogram_3d_bin=histogram_3d_bin,
+                                         k_error_target=k_error_target, starts=starts, coupling=coupling)
+        else:
+            randomwalk_onlat.parallel_method(dim, grid_size, tube_length, tube_radius, num_tubes, orientation,
+                                             timesteps, quiet, plot_save_dir, gen_plots, kapitza, prob_m_cn,
+                                             num_walkers, printout_inc, k_conv_error_buffer, disable_func, rank, size,
+                                             rules_test, restart, inert_vol, save_loc_plots, engine=engine,
+                                             steady_state_method=steady_state_method, seed=seed,
+                                             histogram_comm=histogram_comm, schedule=schedule,
+                                             grid_build=grid_build, comm=comm,
+                                             threads=threads, k_convergence_tolerance=k_convergence_tolerance,
+                                             begin_cov_check=begin_cov_check, histogram_3d_bin=histogram_3d_bin,
+                                             k_error_target=k_error_target, starts=starts, coupling=coupling)
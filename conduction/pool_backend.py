@@ -0,0 +1,218 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+
+"""pool_backend.py
+CONDUCTION package
+
+Constant flux walks on the cores of one machine through a concurrent.futures process pool, no MPI launcher needed.
+The grid is built once and its arrays are put in multiprocessing.shared_memory, which every worker maps read only.
+Workers walk batches of slots of the injection schedule with rules_onlat.walk_slots_onlat and return endpoint deltas,
+the parent adds them to H in slot order and does the analysis. With the same seed, n workers give the same walks as n
+MPI cores."""
+
+from __future__ import division
+import logging
+import time
+from concurrent import futures
+from multiprocessing import shared_memory
+import numpy as np
+
+from conduction import analysis
+from conduction import plots
+from conduction import random_streams
+from conduction import randomwalk_2d
+from conduction import randomwalk_3d
+from conduction import rules_onlat
+from conduction import scheduler
+from conduction import transitions
+
+worker_grid = None  # grid of a worker process, mapped by init_worker
+worker_schedule = None  # (slot_times, slot_pairs) of the injection schedule, set by init_worker
+
+
+def share_grid(grid):
+    """Copies every array of grid, or of any object with __getstate__/__setstate__ like its transition table, into a
+    shared memory block. Returns the blocks, to be unlinked by the caller, and the arguments of attach_grid"""
+    state = grid.__getstate__()
+    arrays = dict((name, value) for name, value in state.items() if isinstance(value, np.ndarray))
+    small_state = dict((name, value) for name, value in state.items() if name not in arrays)
+    blocks = []
+    layout = []
+    for name in sorted(arrays):
+        value = arrays[name]
+        block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        blocks.append(block)
+        layout.append((name, block.name, value.shape, value.dtype.str))
+    return blocks, (type(grid), small_state, layout)
+
+
+def attach_grid(grid_class, small_state, layout):
+    """Maps the shared arrays of a share_grid read only into the worker and returns the grid (or table)"""
+    state = dict(small_state)
+    blocks = []
+    for name, block_name, shape, dtype in layout:
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        state[name] = array
+        blocks.append(block)
+    grid = grid_class.__new__(grid_class)
+    grid.__setstate__(state)
+    grid.shared_blocks = blocks  # keep the memory mapped as long as the grid
+    return grid
+
+
+def init_worker(grid_args, table_args, slot_times, slot_pairs):
+    """Pool initializer, maps the shared grid and its transition table (if compiled) and keeps the injection schedule
+    the batches are cut from"""
+    global worker_grid, worker_schedule
+    worker_grid = attach_grid(*grid_args)
+    if table_args is not None:
+        worker_grid.transitions = attach_grid(*table_args)
+    worker_schedule = (slot_times, slot_pairs)
+
+
+def walk_batch(engine, batch, first_slot, stop_slot, kapitza, prob_m_cn, rules_test, seed, size, starts='random',
+               coupling='independent'):
+    """Runs in a worker, endpoint deltas of slots first_slot ... stop_slot - 1 on the shared grid"""
+    slot_times, slot_pairs = worker_schedule
+    deltas, paths = rules_onlat.walk_slots_onlat(worker_grid, engine, range(first_slot, stop_slot), slot_times,
+                                                 slot_pairs, kapitza, prob_m_cn, rules_test, seed, size,
+                                                 starts=starts, coupling=coupling)
+    return batch, deltas
+
+
+def ordered_results(pool, batch_args, in_flight):
+    """Submits walk_batch for every batch_args, at most in_flight at a time, and yields (batch, deltas) in batch order.
+    Workers keep walking the batches ahead while the caller analyses"""
+    pending = set()
+    done = {}  # results that came back ahead of an earlier batch
+    next_submit = 0
+    next_yield = 0
+    while next_yield < len(batch_args):
+        while next_submit < len(batch_args) and len(pending) < in_flight:
+            pending.add(pool.submit(walk_batch, *batch_args[next_submit]))
+            next_submit += 1
+        finished, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for future in finished:
+            batch, deltas = future.result()
+            done[batch] = deltas
+        while next_yield in done:
+            yield next_yield, done.pop(next_yield)
+            next_yield += 1
+
+
+def parallel_method(dim, grid_size, tube_length, tube_radius, num_tubes, orientation, tot_time, quiet, plot_save_dir,
+                    gen_plots, kapitza, prob_m_cn, tot_walkers, printout_inc, k_conv_error_buffer, disable_func,
+                    rules_test, inert_vol, workers, engine='scalar', seed=None, k_convergence_tolerance=None,
+                    begin_cov_check=0, histogram_3d_bin=1, k_error_target=None, starts='random',
+                    coupling='independent'):
+    seed = random_streams.run_seed(seed)
+    logging.info('Using run seed %d' % seed)
+
+    # serial tube generation
+    np.random.seed(random_streams.legacy_seed(seed))
+    hooks = {2: randomwalk_2d, 3: randomwalk_3d}[dim]
+    grid = hooks.new_grid(grid_size, tube_length, num_tubes, orientation, tube_radius, plot_save_dir, disable_func,
+                          rules_test, inert_vol)
+    if gen_plots:
+        hooks.plot_setup(grid, quiet, plot_save_dir, inert_vol)
+
+    start = time.time()
+
+    series = analysis.KSeries(begin_cov_check, k_conv_error_buffer, k_convergence_tolerance, k_error_target)
+    bins = grid.size + 1
+    edges = list(range(0, bins))
+    start_k_err_check = tot_time / 2
+
+    # the injection schedule cut into slots and batches like the dynamic MPI schedule does, scalar streams are keyed by
+    # workers as by cores
+    num_pairs = int(tot_walkers / 2)
+    if num_pairs < 1:
+        logging.error('Need at least one hot/cold walker pair')
+        raise SystemExit
+    if num_pairs <= tot_time:
+        logging.info('Adding 1 hot/cold walker pair every %.4g timesteps. Likely will not have enough walkers.'
+                     % (tot_time / num_pairs))
+    else:
+        logging.info('Adding %.4g hot/cold walker pairs every timestep' % (num_pairs / tot_time))
+    slot_times, slot_pairs = scheduler.injection_slots(num_pairs, tot_time)
+    num_slots = len(slot_times)
+    batches = scheduler.slot_batches(slot_times, printout_inc, workers)
+
+    # H kept histogram_3d_bin cells per side in 3D, the fit keeps the profile collapsed over z that k needs
+    shape = (grid.size + 1,) * dim
+    H_bins = transitions.histogram_bins(shape, histogram_3d_bin if dim == 3 else 1)
+    H_master = np.zeros(transitions.binned_shape(shape, H_bins), dtype=int)
+    fit = analysis.ProfileFit(grid.size, dim)  # the temperature profile fit, kept up to date
+    # the grid and the transition table the vectorized engine walks on, compiled once here
+    blocks, grid_args = share_grid(grid)
+    table_args = None
+    if engine == 'vectorized':
+        table_blocks, table_args = share_grid(grid.compile_transitions(kapitza, prob_m_cn))
+        blocks.extend(table_blocks)
+    try:
+        with futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                         initargs=(grid_args, table_args, slot_times, slot_pairs)) as pool:
+            batch_args = [(engine, batch, batches[batch], batches[batch + 1], kapitza, prob_m_cn, rules_test, seed,
+                           workers, starts, coupling) for batch in range(len(batches) - 1)]
+            for batch, deltas in ordered_results(pool, batch_args, 2 * workers):
+                # results come back in batch order, so H_master is always a whole prefix of the schedule
+                transitions.add_endpoint_deltas(H_master, transitions.binned_deltas(deltas, shape, H_bins))
+                fit.add_deltas(deltas)
+                slot = batches[batch + 1] - 1  # last slot of the batch
+                last = (slot == num_slots - 1)
+                if slot == 0 or not (last or slot_times[slot + 1] // printout_inc > slot_times[slot] // printout_inc):
+                    continue
+                cur_num_walkers = 2 * slot_pairs[slot + 1]
+                dt_dx, heat_flux, gradient_err, k, k_err, r2 = fit.fit(tot_walkers, tot_time)
+                series.add(k, dt_dx, heat_flux, slot_times[slot], cur_num_walkers)
+                logging.info("Slot %d out of %d, timestep %d, %d walkers, R2: %.4f, "
+                             "k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E"
+                             % (slot + 1, num_slots, slot_times[slot], cur_num_walkers, r2, k, heat_flux, dt_dx))
+                if series.converged(cur_num_walkers):
+                    logging.info('k converged, stopping with %d walkers' % cur_num_walkers)
+                    break
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    if not series.k_list:
+        # a single slot never reaches a checkpoint, k from the final histogram
+        dt_dx, heat_flux, gradient_err, k, k_err, r2 = fit.fit(tot_walkers, tot_time)
+        series.add(k, dt_dx, heat_flux, slot_times[-1], 2 * num_pairs)
+
+    logging.info('Finished random walks, histogramming...')
+    analysis.final_conductivity_onlat(plot_save_dir, prob_m_cn, series.dt_dx_list, series.k_list, k_conv_error_buffer,
+                                      series.k_blocking)
+    end = time.time()
+    logging.info("Constant flux simulation has completed")
+    logging.info("Using %d workers, pool simulation time was %.4f min" % (workers, (end - start) / 60.0))
+    walk_sec = tot_walkers / (end - start)
+    logging.info("Crunched %.4f walkers/second" % walk_sec)
+    if dim == 3 and histogram_3d_bin > 1:
+        np.save('%s/temp_3d_bin%d.npy' % (plot_save_dir, histogram_3d_bin), H_master)
+    temp_profile = plots.plot_colormap_2d(grid, fit.profile, quiet, plot_save_dir, gen_plots)  # z collapsed in 3D
+    if gen_plots:
+        plots.plot_k_convergence(series.k_list, quiet, plot_save_dir, series.timestep_list)
+        plots.plot_k_convergence_err(series.k_list, quiet, plot_save_dir, start_k_err_check, series.timestep_list)
+        plots.plot_dt_dx(series.dt_dx_list, quiet, plot_save_dir, series.timestep_list)
+        plots.plot_heat_flux(series.heat_flux_list, quiet, plot_save_dir, series.timestep_list)
+        temp_gradient_x = plots.plot_temp_gradient_2d_onlat(grid, temp_profile, edges, edges, quiet,
+                                                            plot_save_dir, gradient_cutoff=0)
+        gradient_avg, gradient_std = plots.plot_linear_temp(temp_profile, grid_size, quiet, plot_save_dir,
+                                                            gen_plots)
+    logging.info("Complete")
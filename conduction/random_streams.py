@@ -0,0 +1,215 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+
+"""random_streams.py
+CONDUCTION package
+
+Reproducible random numbers for the walks. Every stream is a Philox generator keyed by (run seed, rank, walker id)
+through SeedSequence spawn keys, so any walker can be replayed on its own. Streams hand out uniforms from blocks
+drawn in bulk, and randint/random follow the np.random calls in the rules, so a stream can stand in for np.random.
+
+The hot and cold walker of a pair can also share a stream, common random numbers, and the wall starts can follow
+a design over the pair ids instead of being drawn, both to get the same k error with fewer walkers.
+
+Batches of the vectorized engine draw from CounterStreams instead, a hash of the walker key and how far the walker
+has got, so a walker walks the same whatever batch, thread or core it ends up in."""
+
+from __future__ import division
+import logging
+import numpy as np
+
+STARTS_KEY = 2 ** 32  # first spawn key of the start designs, beyond any rank
+COUNTER_KEY = 2 ** 32 + 2  # spawn key of the counter stream keys, beyond the start designs
+DRAWS_PER_STEP = 3  # counter draws of a step: move choice, acceptance and square within a tube
+START_DRAW = 2 ** 62  # counter of the first wall start draw, beyond any walk
+
+
+class RandomStream(object):
+    def __init__(self, seed, key, block_size=4096):
+        """Stream for run seed and spawn key, a tuple like (rank, walker id)"""
+        self.seed = seed
+        self.key = tuple(key)
+        self.block_size = block_size
+        self.generator = np.random.Generator(np.random.Philox(np.random.SeedSequence(seed, spawn_key=self.key)))
+        self.block = []
+        self.used = 0
+
+    def draw(self, num):
+        """num new uniforms from the generator, as a list"""
+        return self.generator.random(num).tolist()
+
+    def uniform_block(self, num):
+        """Next num uniforms [0.0, 1.0) of the stream, as a list"""
+        if self.used + num > len(self.block):
+            # keep the unused tail so the sequence does not depend on how it is requested
+            self.block = self.block[self.used:] + self.draw(max(self.block_size, num))
+            self.used = 0
+        out = self.block[self.used:self.used + num]
+        self.used += num
+        return out
+
+    def random(self, size=None):
+        """Same as np.random.random"""
+        if size is None:
+            if self.used >= len(self.block):
+                self.block = self.draw(self.block_size)
+                self.used = 0
+            u = self.block[self.used]
+            self.used += 1
+            return u
+        return np.asarray(self.uniform_block(int(np.prod(size))), dtype=float).reshape(size)
+
+    def randint(self, low, high=None, size=None):
+        """Same as np.random.randint, high excluded"""
+        if high is None:
+            low, high = 0, low
+        if size is None:
+            return low + int(self.random() * (high - low))
+        return low + (self.random(size) * (high - low)).astype(int)
+
+
+def run_seed(seed=None):
+    """Seed of the run. A fresh one is drawn if none is given, log it to replay the run"""
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    return seed
+
+
+def walker_stream(seed, rank, walker_id):
+    """Stream of a single walker"""
+    return RandomStream(seed, (rank, walker_id))
+
+
+def pair_streams(seed, rank, pair, coupling='independent'):
+    """Streams of the hot and cold walker of a pair. independent gives each its own stream, common has the cold
+    walker replay the stream of the hot one. The coupled walkers stay in step until their walks need different
+    numbers of draws"""
+    hot_stream = walker_stream(seed, rank, 2 * pair)
+    if coupling == 'independent':
+        return hot_stream, walker_stream(seed, rank, 2 * pair + 1)
+    elif coupling == 'common':
+        return hot_stream, walker_stream(seed, rank, 2 * pair)
+    logging.error('Invalid pair coupling %s' % coupling)
+    raise SystemExit
+
+
+def mix64(x):
+    """SplitMix64 finalizer of uint64 x, a bijection that scrambles every bit"""
+    x = np.asarray(x, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def walker_keys(seed, walker_ids):
+    """Counter stream keys of the walkers with the given ids, different for every id"""
+    base = np.random.SeedSequence(seed, spawn_key=(COUNTER_KEY,)).generate_state(1, np.uint64)[0]
+    return mix64(np.asarray(walker_ids, dtype=np.uint64) * np.uint64(0x9e3779b97f4a7c15) + base)
+
+
+def counter_uniforms(key, counter):
+    """Uniform [0.0, 1.0) of every walker key for draw counter"""
+    offset = mix64(np.full(1, counter % 2 ** 64, dtype=np.uint64))  # an array, numpy warns on scalar wraparound
+    return (mix64(key ^ offset) >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+
+class CounterStreams(object):
+    def __init__(self, key, step=0):
+        """Counter based streams of the walkers with keys key at the same step, standing in for np.random in
+        TransitionTable.step. Draw j of step t of a walker is counter_uniforms at DRAWS_PER_STEP * t + j, whichever
+        walkers it is drawn with"""
+        self.key = key
+        self.step = step
+        self.draw = 0
+
+    def random(self, size=None):
+        """Next draw of every walker, size is their number"""
+        if size is not None and int(np.prod(size)) != len(self.key):
+            logging.error('Counter streams draw once for every walker')
+            raise SystemExit
+        u = counter_uniforms(self.key, DRAWS_PER_STEP * self.step + self.draw)
+        self.draw += 1
+        return u
+
+    def subset(self, which):
+        """Streams of the walkers in which for the next draw, the others skip it"""
+        streams = CounterStreams(self.key[which], self.step)
+        streams.draw = self.draw
+        self.draw += 1
+        return streams
+
+
+def counter_wall_starts(key, grid_size, dim):
+    """Wall squares (y(, z)) drawn from the counter streams of the walkers with keys key, len(key) x (dim - 1)"""
+    return np.column_stack([(counter_uniforms(key, START_DRAW + j) * (grid_size + 1)).astype(int)
+                            for j in range(1, dim)]).reshape(len(key), dim - 1)
+
+
+def radical_inverse(index, base):
+    """Van der Corput sequence in base at each index"""
+    index = np.array(index, dtype=np.int64)
+    out = np.zeros(index.shape)
+    scale = 1.0 / base
+    while np.any(index > 0):
+        out += scale * (index % base)
+        index //= base
+        scale /= base
+    return out
+
+
+def wall_starts(seed, starts, pairs, grid_size, dim, wall=0):
+    """Wall squares (y(, z)) of the walkers of the hot (wall 0) or cold (wall 1) wall with the given pair ids,
+    len(pairs) x (dim - 1). stratified is a Latin hypercube over every grid_size + 1 consecutive pair ids, each
+    wall row (and column) once in random order. halton is the Halton sequence in bases 2 and 3 at the pair id,
+    shifted by a random offset. None for random, the walkers draw their own starts"""
+    pairs = np.asarray(pairs, dtype=np.int64)
+    if starts == 'random':
+        return None
+    elif starts == 'stratified':
+        out = np.zeros((len(pairs), dim - 1), dtype=int)
+        for block in np.unique(pairs // (grid_size + 1)):
+            generator = np.random.Generator(np.random.Philox(np.random.SeedSequence(
+                seed, spawn_key=(STARTS_KEY, wall, int(block)))))
+            rows = np.column_stack([generator.permutation(grid_size + 1) for j in range(dim - 1)])
+            in_block = (pairs // (grid_size + 1) == block)
+            out[in_block] = rows[pairs[in_block] % (grid_size + 1)]
+        return out
+    elif starts == 'halton':
+        generator = np.random.Generator(np.random.Philox(np.random.SeedSequence(seed, spawn_key=(STARTS_KEY, wall))))
+        shift = generator.random(dim - 1)
+        u = np.column_stack([radical_inverse(pairs, base) for base in [2, 3][:dim - 1]])
+        return ((u + shift) % 1.0 * (grid_size + 1)).astype(int)
+    logging.error('Invalid walker starts %s' % starts)
+    raise SystemExit
+
+
+def pair_starts(seed, starts, coupling, pairs, grid_size, dim):
+    """Wall squares of the hot and cold walkers of the given pair ids, see wall_starts. Coupled cold walkers start
+    where their hot walker does, as their streams would have them with random starts"""
+    hot_starts = wall_starts(seed, starts, pairs, grid_size, dim, 0)
+    if hot_starts is None or coupling == 'independent':
+        return hot_starts, wall_starts(seed, starts, pairs, grid_size, dim, 1)
+    return hot_starts, hot_starts
+
+
+def legacy_seed(seed):
+    """32 bit seed for the code still drawing from the global np.random state (tube generation). Comes from the
+    root sequence of the run, which no walker stream uses"""
+    return int(np.random.SeedSequence(seed).generate_state(1)[0])
+
+
+def member_seed(seed, member):
+    """Run seed of one member of an ensemble run with seed"""
+    return int(np.random.SeedSequence(seed, spawn_key=(member,)).generate_state(1, np.uint64)[0])
@@ -0,0 +1,453 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""randomwalk_onlat.py
+CONDUCTION package
+
+The MPI constant flux driver of 2D and 3D on lattice walks: restart from a checkpoint, the run seed, building and
+sharing the grid, the live, dynamic and static schedules with their histogram reductions and checkpoints, and the
+final k. What depends on the dimension, building and plotting the grid and the walker paths, comes from
+randomwalk_2d/randomwalk_3d."""
+
+from __future__ import division
+import logging
+import numpy as np
+from concurrent import futures
+from mpi4py import MPI
+
+from conduction import analysis
+from conduction import backend
+from conduction import master_equation
+from conduction import plots
+from conduction import random_streams
+from conduction import randomwalk_2d
+from conduction import randomwalk_3d
+from conduction import rules_onlat
+from conduction import scheduler
+from conduction import shared_grid
+from conduction import transitions
+
+dim_hooks = {2: randomwalk_2d, 3: randomwalk_3d}
+
+
+def walk_slots(grid, engine, slots, slot_times, slot_pairs, kapitza, prob_m_cn, rules_test, seed, size,
+               save_loc_plots, quiet, plot_save_dir, pair_offset=0, threads=1, thread_pool=None, starts='random',
+               coupling='independent'):
+    """rules_onlat.walk_slots_onlat, plotting the walker paths if desired"""
+    deltas, paths = rules_onlat.walk_slots_onlat(grid, engine, slots, slot_times, slot_pairs, kapitza, prob_m_cn,
+                                                 rules_test, seed, size, record=save_loc_plots,
+                                                 pair_offset=pair_offset, threads=threads, thread_pool=thread_pool,
+                                                 starts=starts, coupling=coupling)
+    for slot in sorted(paths):
+        dim_hooks[len(grid.bound)].plot_walker_paths(paths[slot], grid.size, quiet, slot // size, plot_save_dir)
+    return deltas
+
+
+def parallel_method(dim, grid_size, tube_length, tube_radius, num_tubes, orientation, tot_time, quiet, plot_save_dir,
+                    gen_plots, kapitza, prob_m_cn, tot_walkers, printout_inc, k_conv_error_buffer, disable_func, rank,
+                    size, rules_test, restart, inert_vol, save_loc_plots, engine='scalar',
+                    steady_state_method='direct', seed=None, histogram_comm='sparse',
+                    schedule='static', grid_build='shared', comm=None,
+                    threads=1, k_convergence_tolerance=None, begin_cov_check=0, histogram_3d_bin=1,
+                    k_error_target=None, starts='random', coupling='independent'):
+    if comm is None:
+        comm = MPI.COMM_WORLD
+    hooks = dim_hooks[dim]
+
+    # restart from the checkpoint in plot_save_dir, resuming it or extending a finished run to more walkers
+    checkpoint = None
+    resume = False
+    prior_walkers = 0  # walkers of the finished runs this one extends
+    if restart:
+        if rank == 0:
+            checkpoint = backend.load_checkpoint(plot_save_dir)
+        checkpoint = comm.bcast(checkpoint, root=0)
+        if checkpoint is None or engine not in ['scalar', 'vectorized']:
+            logging.error('Restart needs the scalar or vectorized engine and a checkpoint in %s' % plot_save_dir)
+            raise SystemExit
+        if int(checkpoint['tot_time']) != tot_time:
+            logging.error('Restart needs the %d timesteps of the checkpointed run' % checkpoint['tot_time'])
+            raise SystemExit
+        seed = int(str(checkpoint['seed']))
+        resume = int(checkpoint['done_slots']) < int(checkpoint['num_slots'])
+        if resume:
+            prior_walkers = int(checkpoint['prior_walkers'])
+            if int(checkpoint['tot_walkers']) != tot_walkers:
+                logging.error('Finish the checkpointed run first, restart with %d num_walkers'
+                              % checkpoint['tot_walkers'])
+                raise SystemExit
+        elif tot_walkers > int(checkpoint['tot_walkers']):
+            prior_walkers = int(checkpoint['tot_walkers'])
+        else:
+            logging.error('Checkpointed run is finished, give more than %d num_walkers to extend it'
+                          % checkpoint['tot_walkers'])
+            raise SystemExit
+    run_walkers = tot_walkers - prior_walkers
+
+    # every random number of the run follows from seed, drawn on core 0 if not given
+    if rank == 0:
+        seed = random_streams.run_seed(seed)
+        logging.info('Using run seed %d' % seed)
+    seed = comm.bcast(seed, root=0)
+
+    # serial tube generation, on core 0 or repeated by every core from the same seed
+    if rank == 0 and restart:
+        grid = backend.load_grid(plot_save_dir)
+    elif rank == 0 or grid_build == 'regenerate':
+        np.random.seed(random_streams.legacy_seed(seed))
+        grid = hooks.new_grid(grid_size, tube_length, num_tubes, orientation, tube_radius, plot_save_dir,
+                              disable_func, rules_test, inert_vol, rank=rank, size=size)
+
+    comm.Barrier()
+
+    if rank == 0:
+        if not restart and engine in ['scalar', 'vectorized']:
+            backend.save_grid(plot_save_dir, grid)
+        if gen_plots:
+            hooks.plot_setup(grid, quiet, plot_save_dir, inert_vol)
+    elif grid_build == 'shared':
+        grid = None
+
+    comm.Barrier()
+    if grid_build == 'regenerate':
+        grid = shared_grid.regenerated_grid(grid, comm)
+    else:
+        grid = shared_grid.share_grid(grid, comm)
+    if engine in ['vectorized', 'live']:
+        # the transition table is larger than the grid, core 0 compiles it and every node maps it like the grid
+        table = grid.compile_transitions(kapitza, prob_m_cn) if rank == 0 else None
+        grid.transitions = shared_grid.share_object(table, comm)
+
+    bins = grid.size + 1
+
+    start = MPI.Wtime()
+
+    edges = list(range(0, bins))
+    start_k_err_check = tot_time / 2
+    # k, dT(x)/dx and heat flux of every analysis, only kept on core 0
+    # the deterministic engines have no statistical error to block
+    deterministic = engine in ['master_equation', 'steady_state']
+    series = analysis.KSeries(begin_cov_check, k_conv_error_buffer, k_convergence_tolerance, k_error_target,
+                              blocked=not deterministic)
+
+    # injection schedule, the hot/cold walker pairs spread evenly over tot_time timesteps
+    num_pairs = int(run_walkers / 2)
+    if num_pairs < 1:
+        logging.error('Need at least one hot/cold walker pair')
+        raise SystemExit
+    if num_pairs <= tot_time:
+        logging.info('Adding 1 hot/cold walker pair every %.4g timesteps. Likely will not have enough walkers.'
+                     % (tot_time / num_pairs))
+    else:
+        logging.info('Adding %.4g hot/cold walker pairs every timestep' % (num_pairs / tot_time))
+
+    comm.Barrier()
+
+    if deterministic and k_error_target:
+        logging.warning('%s engine is deterministic, there is no blocking error, k_error_target ignored' % engine)
+    if engine != 'scalar' and save_loc_plots:
+        logging.warning('%s engine does not keep walker paths, save_loc_plots ignored' % engine)
+    if schedule == 'dynamic' and engine in ['scalar', 'vectorized'] and size < 2:
+        logging.warning('Dynamic schedule needs cores besides core 0 to walk, using static')
+        schedule = 'static'
+    if dim != 3:
+        histogram_3d_bin = 1
+    if histogram_3d_bin != 1:
+        if engine in ['master_equation', 'steady_state']:
+            logging.warning('%s engine keeps the whole 3D histogram, histogram_3d_bin ignored' % engine)
+            histogram_3d_bin = 1
+        elif histogram_comm == 'dense':
+            logging.warning('Binned 3D histograms are built from endpoints, using sparse histogram_comm')
+            histogram_comm = 'sparse'
+
+    # slots of the injection schedule, each one injection time walked by one core. Slot s holds pairs
+    # slot_pairs[s] ... slot_pairs[s + 1] - 1, cores without a slot in the last static iteration walk nothing
+    slot_times, slot_pairs = scheduler.injection_slots(num_pairs, tot_time)
+    num_slots = len(slot_times)
+    num_iterations = -(-num_slots // size)
+    first_slot = 0
+    pair_offset = 0  # walker pair ids already used by earlier runs
+    if checkpoint is not None:
+        if resume:
+            first_slot = int(checkpoint['done_slots'])
+            pair_offset = int(checkpoint['pair_offset'])
+            if int(checkpoint['size']) != size or (schedule == 'static' and first_slot % size != 0):
+                logging.error('Resume on the %d cores of the checkpointed run, with the dynamic schedule if it '
+                              'stopped mid iteration' % checkpoint['size'])
+                raise SystemExit
+        else:
+            pair_offset = int(checkpoint['pair_offset']) + int(checkpoint['num_pairs'])
+        if rank == 0:
+            logging.info('Restarting at slot %d of %d, %d walkers of earlier runs'
+                         % (first_slot, num_slots, prior_walkers))
+    # threads of this core, each walking whole slots of the vectorized batches
+    thread_pool = None
+    if threads > 1:
+        if engine != 'vectorized':
+            logging.warning('Threads split vectorized batches only, the %s engine runs on one' % engine)
+        else:
+            thread_pool = futures.ThreadPoolExecutor(max_workers=threads)
+    run_state = dict(seed=str(seed), size=size, tot_time=tot_time, tot_walkers=tot_walkers,
+                     prior_walkers=prior_walkers, pair_offset=pair_offset, num_slots=num_slots,
+                     num_pairs=num_pairs)
+
+    # k only needs H collapsed over z in 3D, which the fit keeps. H itself is kept histogram_3d_bin cells per side,
+    # so runs that only want k can hold and send O(grid_size**2) instead of the whole cube
+    shape = (grid.size + 1,) * dim
+    H_bins = transitions.histogram_bins(shape, histogram_3d_bin)
+    binned = histogram_3d_bin != 1
+    H_local = np.zeros(transitions.binned_shape(shape, H_bins), dtype=int)
+    H_restored = np.zeros_like(H_local)
+    profile_restored = None
+    if checkpoint is not None:
+        if checkpoint['H'].shape != H_local.shape:
+            logging.error('Restart with the histogram_3d_bin of the checkpointed run')
+            raise SystemExit
+        H_restored = checkpoint['H'].astype(int)
+        profile_restored = checkpoint.get('profile', H_restored)
+        series.restore(checkpoint)
+
+    # injection timestep of every walker pair
+    inject_times = scheduler.injection_times(num_pairs, tot_time)
+
+    if engine == 'master_equation':
+        # deterministic, no walkers. Core 0 evolves the expected histogram
+        if rank == 0:
+            H_master, series.k_list, series.dt_dx_list, series.heat_flux_list, series.timestep_list = \
+                master_equation.constant_flux(grid, kapitza, prob_m_cn, inject_times, tot_walkers, tot_time,
+                                              printout_inc)
+    elif engine == 'steady_state':
+        # long time limit of master_equation from one sparse solve, k for a quick screen of configurations
+        if rank == 0:
+            H_master, k, dt_dx, heat_flux = master_equation.steady_state_conductivity(
+                grid, kapitza, prob_m_cn, tot_walkers, tot_time, method=steady_state_method)
+            series.k_list = [k]
+            series.dt_dx_list = [dt_dx]
+            series.heat_flux_list = [heat_flux]
+            series.timestep_list = [tot_time]
+    elif engine == 'live':
+        # one persistent population per core. Pairs are injected on schedule and everyone is
+        # advanced together, so every printout_inc timesteps the histogram is just the current positions
+        inject_local = np.bincount(inject_times[rank::size], minlength=tot_time)  # pair j goes to core j % size
+        inject_total = np.cumsum(np.bincount(inject_times, minlength=tot_time))
+        # pairs are injected in order, so the population draws from the stream of its first walker. Coupled hot
+        # and cold walkers are kept in populations of their own
+        if coupling == 'independent':
+            pops = [transitions.Population_onlat(grid.size, dim, rules_test,
+                                                 random_streams.walker_stream(seed, rank, 2 * rank))]
+        else:
+            pops = [transitions.Population_onlat(grid.size, dim, rules_test, stream)
+                    for stream in random_streams.pair_streams(seed, rank, rank, coupling)]
+        local_pairs = np.arange(rank, num_pairs, size)  # pair ids of this core, in injection order
+        num_injected = 0
+        stop = scheduler.StopSignal(comm)
+        converged = False
+        for core_time in range(tot_time):
+            pops = [rules_onlat.apply_moves_onlat_vec(pop, kapitza, grid, prob_m_cn, grid.bound) for pop in pops]
+            if inject_local[core_time] > 0:
+                new_pairs = local_pairs[num_injected:num_injected + inject_local[core_time]]
+                num_injected += inject_local[core_time]
+                hot_starts, cold_starts = random_streams.pair_starts(seed, starts, coupling, new_pairs, grid.size,
+                                                                     dim)
+                pops[0].add_walkers('hot', inject_local[core_time], hot_starts)
+                pops[-1].add_walkers('cold', inject_local[core_time], cold_starts)
+            if ((core_time + 1) % printout_inc != 0) and (core_time != tot_time - 1):
+                continue
+            if stop.stopped():
+                break
+            # histogram snapshot
+            H_master = np.zeros_like(H_local)
+            if not binned:
+                H_local = sum(pop.histogram() for pop in pops)
+            else:
+                # the binned histogram and the profile collapsed over z, never the whole cube
+                pop_deltas = np.concatenate([transitions.endpoint_deltas(pop.cell, pop.sign) for pop in pops])
+                H_local = np.zeros_like(H_master)
+                transitions.add_endpoint_deltas(H_local, transitions.binned_deltas(pop_deltas, shape, H_bins))
+                profile_local = np.zeros(shape[:2], dtype=int)
+                transitions.add_endpoint_deltas(profile_local,
+                                                transitions.binned_deltas(pop_deltas, shape, (1, 1, shape[2])))
+                profile_master = np.zeros_like(profile_local)
+                comm.Reduce(profile_local, profile_master, op=MPI.SUM, root=0)
+            comm.Reduce(H_local, H_master, op=MPI.SUM, root=0)
+            if rank == 0:
+                cur_num_walkers = 2 * inject_total[core_time]
+                fit = analysis.ProfileFit(grid.size, dim, profile_master if binned else H_master)
+                dt_dx, heat_flux, gradient_err, k, k_err, r2 = fit.fit(tot_walkers, tot_time)
+                series.add(k, dt_dx, heat_flux, core_time + 1, cur_num_walkers)
+                logging.info("Timestep %d out of %d, %d walkers, R2: %.4f, "
+                             "k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E"
+                             % (core_time + 1, tot_time, cur_num_walkers, r2, k, heat_flux, dt_dx))
+                converged = series.converged(cur_num_walkers)
+                if converged:
+                    logging.info('k converged at timestep %d, stopping at the next checkpoint' % (core_time + 1))
+            stop.post(converged)
+    elif schedule == 'dynamic':
+        # core 0 hands out batches of slots of the injection schedule and analyses, the other cores walk whatever they
+        # are given. Every checkpoint interval is cut into a batch per walking core
+        batches = scheduler.slot_batches(slot_times, printout_inc, size - 1, first_slot)
+        if thread_pool is not None and np.diff(batches).min() < threads:
+            logging.warning('Batches of as few as %d slots, threads beyond that stay idle' % np.diff(batches).min())
+        if rank == 0:
+            H_master = H_restored.copy()
+            fit = analysis.ProfileFit(grid.size, dim, profile_restored)  # the temperature profile fit, kept up to date
+            results = scheduler.master_results(comm, len(batches) - 1)
+            for batch, deltas in results:
+                # results come back in batch order, so H_master is always a whole prefix of the schedule
+                transitions.add_endpoint_deltas(H_master, transitions.binned_deltas(deltas, shape, H_bins))
+                fit.add_deltas(deltas)
+                slot = batches[batch + 1] - 1  # last slot of the batch
+                last = (slot == num_slots - 1)
+                if slot == 0 or not (last or slot_times[slot + 1] // printout_inc > slot_times[slot] // printout_inc):
+                    continue
+                cur_num_walkers = prior_walkers + 2 * slot_pairs[slot + 1]
+                dt_dx, heat_flux, gradient_err, k, k_err, r2 = fit.fit(tot_walkers, tot_time)
+                series.add(k, dt_dx, heat_flux, slot_times[slot], cur_num_walkers)
+                logging.info("Slot %d out of %d, timestep %d, %d walkers, R2: %.4f, "
+                             "k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E"
+                             % (slot + 1, num_slots, slot_times[slot], cur_num_walkers, r2, k, heat_flux, dt_dx))
+                backend.save_checkpoint(plot_save_dir, H_master, series, slot + 1, run_state,
+                                        profile=fit.profile if binned else None)
+                if series.converged(cur_num_walkers):
+                    logging.info('k converged, stopping with %d walkers' % cur_num_walkers)
+                    results.close()  # workers finish the slots they hold
+                    break
+        else:
+            for batch in scheduler.worker_slots(comm):
+                deltas = walk_slots(grid, engine, range(batches[batch], batches[batch + 1]), slot_times, slot_pairs,
+                                    kapitza, prob_m_cn, rules_test, seed, size, save_loc_plots, quiet, plot_save_dir,
+                                    pair_offset, threads, thread_pool, starts, coupling)
+                scheduler.return_result(comm, batch, deltas)
+    else:
+        # ranks walk independently. H is only summed at printout_inc checkpoints, without blocking, so the
+        # walks go on while core 0 waits for the previous checkpoint
+        pending = []  # in flight reductions
+        # sparse sends only the new endpoints of each core, core 0 keeps adding them to one H_master
+        deltas_local = [np.zeros(0, dtype=int)]
+        if histogram_comm == 'sparse':
+            H_master = H_restored.copy()
+            fit = analysis.ProfileFit(grid.size, dim, profile_restored)  # the temperature profile fit, kept up to date
+        elif rank == 0:
+            H_local = H_restored.copy()  # summed into H_master with the walks of every core
+        # core 0 decides at every analysis whether k has converged, the other cores hear at the next checkpoint
+        stop = scheduler.StopSignal(comm)
+        converged = False
+        # the checkpoints are the iterations after which the injection time reaches the next multiple of
+        # printout_inc. Every core walks its slots of the iterations up to a checkpoint as one batch
+        checkpoints = [i for i in range(first_slot // size, num_iterations) if i == num_iterations - 1
+                       or slot_times[min((i + 1) * size, num_slots - 1)] // printout_inc
+                       > slot_times[i * size] // printout_inc]
+        if thread_pool is not None and min(np.diff([first_slot // size - 1] + checkpoints)) < threads:
+            logging.warning('Batches of as few as %d slots, threads beyond that stay idle'
+                            % min(np.diff([first_slot // size - 1] + checkpoints)))
+        batch_start = first_slot // size
+        for i in checkpoints:
+            slots = [j * size + rank for j in range(batch_start, i + 1) if j * size + rank < num_slots]
+            batch_start = i + 1
+            next_slot = min((i + 1) * size, num_slots)
+            core_time = slot_times[min(i * size + rank, num_slots - 1)]
+            cur_num_walkers = 2 * slot_pairs[next_slot]
+            # cores without a slot in the last iterations still join the checkpoints of the other cores
+            deltas = walk_slots(grid, engine, slots, slot_times, slot_pairs, kapitza, prob_m_cn, rules_test, seed, size,
+                                save_loc_plots, quiet, plot_save_dir, pair_offset, threads, thread_pool, starts,
+                                coupling)
+            # histogram
+            if histogram_comm == 'sparse':
+                deltas_local.append(deltas)
+            else:
+                transitions.add_endpoint_deltas(H_local, deltas)
+            last = (i == num_iterations - 1)
+            if stop.stopped():
+                last = True
+            # send to core 0
+            if histogram_comm == 'sparse':
+                H_send = np.concatenate(deltas_local)
+                deltas_local = [np.zeros(0, dtype=int)]
+                counts = comm.gather(len(H_send), root=0)
+                if rank == 0:
+                    H_recv = np.zeros(sum(counts), dtype=H_send.dtype)
+                    request = comm.Igatherv(H_send, [H_recv, counts], root=0)
+                else:
+                    H_recv = None
+                    request = comm.Igatherv(H_send, None, root=0)
+            else:
+                H_send = H_local.copy()
+                H_recv = np.zeros_like(H_local)
+                request = comm.Ireduce(H_send, H_recv, op=MPI.SUM, root=0)
+            pending.append((request, H_send, H_recv, i, core_time, cur_num_walkers))
+            # analysis of finished checkpoints, the newest one stays in flight until the next
+            while len(pending) > (0 if last else 1):
+                request, H_send, H_recv, i_done, core_time_done, num_walkers_done = pending.pop(0)
+                request.Wait()
+                if histogram_comm == 'sparse':
+                    if rank == 0:
+                        transitions.add_endpoint_deltas(H_master, transitions.binned_deltas(H_recv, shape, H_bins))
+                        fit.add_deltas(H_recv)
+                else:
+                    H_master = H_recv
+                    if rank == 0:
+                        fit = analysis.ProfileFit(grid.size, dim, H_master)  # whole H, nothing to update
+                if rank == 0 and (i_done > 0):
+                    # print np.count_nonzero(H_master)
+                    dt_dx, heat_flux, gradient_err, k, k_err, r2 = fit.fit(tot_walkers, tot_time)
+                    # since final k is based on core 0 calculations, heat flux will slide a little since
+                    # core 0 will run slower, and this gives a more accurate result
+                    # np.savetxt("%s/H.txt" % plot_save_dir, H_master, fmt='%d')  # write histo to file
+                    series.add(k, dt_dx, heat_flux, core_time_done, prior_walkers + num_walkers_done)
+                    logging.info("Parallel iteration %d out of %d, timestep %d, %d walkers, R2: %.4f, "
+                                 "k: %.4E, heat flux: %.4E, dT(x)/dx: %.4E"
+                                 % (i_done, num_iterations, core_time_done, prior_walkers + num_walkers_done,
+                                    r2, k, heat_flux, dt_dx))
+                    if not converged and series.converged(prior_walkers + num_walkers_done):
+                        converged = True
+                        logging.info('k converged at timestep %d, stopping at the next checkpoint' % core_time_done)
+                if rank == 0:
+                    backend.save_checkpoint(plot_save_dir, H_master, series, min((i_done + 1) * size, num_slots),
+                                            run_state, profile=fit.profile if binned else None)
+            if last:
+                break
+            stop.post(converged)
+
+    if thread_pool is not None:
+        thread_pool.shutdown()
+    comm.Barrier()  # make sure whole walks are done
+
+    if rank == 0:
+        logging.info('Finished random walks, histogramming...')
+        analysis.final_conductivity_onlat(plot_save_dir, prob_m_cn, series.dt_dx_list, series.k_list,
+                                          k_conv_error_buffer, series.k_blocking)
+        end = MPI.Wtime()
+        logging.info("Constant flux simulation has completed")
+        logging.info("Using %d cores, parallel simulation time was %.4f min" % (size, (end - start) / 60.0))
+        walk_sec = tot_walkers / (end - start)
+        logging.info("Crunched %.4f walkers/second" % walk_sec)
+        if binned:
+            np.save('%s/temp_3d_bin%d.npy' % (plot_save_dir, histogram_3d_bin), H_master)
+            temp_profile_sum = fit.profile  # H collapsed over z
+        elif dim == 3:
+            temp_profile_sum = np.sum(H_master, axis=2)  # collapse z
+        else:
+            temp_profile_sum = H_master
+        temp_profile = plots.plot_colormap_2d(grid, temp_profile_sum, quiet, plot_save_dir, gen_plots)
+        if gen_plots:
+            plots.plot_k_convergence(series.k_list, quiet, plot_save_dir, series.timestep_list)
+            plots.plot_k_convergence_err(series.k_list, quiet, plot_save_dir, start_k_err_check,
+                                         series.timestep_list)
+            plots.plot_dt_dx(series.dt_dx_list, quiet, plot_save_dir, series.timestep_list)
+            plots.plot_heat_flux(series.heat_flux_list, quiet, plot_save_dir, series.timestep_list)
+            temp_gradient_x = plots.plot_temp_gradient_2d_onlat(grid, temp_profile, edges, edges, quiet,
+                                                                plot_save_dir, gradient_cutoff=0)
+            gradient_avg, gradient_std = plots.plot_linear_temp(temp_profile, grid_size, quiet, plot_save_dir,
+                                                                gen_plots)
+        logging.info("Complete")
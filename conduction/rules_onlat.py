@@ -0,0 +1,428 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""rules_onlat.py
+CONDUCTION package
+
+The walk rules of a single on lattice walker in 2D and 3D, one step at a time, and the walk of slots of the
+injection schedule with the scalar or vectorized engine. Squares are indexed with tuple(pos), so the same rules serve
+both dimensions. rules_2d/rules_3d keep the names of the dimension specific versions."""
+
+from __future__ import division
+import logging
+import numpy as np
+
+from conduction import creation_onlat
+from conduction import random_streams
+from conduction import transitions
+
+# having the moves as lists is OK since numpy arrays + list is the standard + we want. moves_2d/moves_3d, a tube end
+# also picks from the same moves once more to jump across the tube
+MOVES = dict((dim, transitions.grid_moves(dim).tolist()) for dim in (2, 3))
+JUMP_MOVES = dict((dim, 2 * MOVES[dim]) for dim in (2, 3))
+
+
+def kill(message="Invalid random walk rule. Check rules."):
+    """Stop the program"""
+    logging.error(message)
+    raise SystemExit
+
+
+def runrandomwalk_onlat(grid, timesteps, temp, kapitza, prob_m_cn, bound, rules_test, rng=np.random,
+                        record=False, start=None):
+    # Start the random walk, for one walker. record keeps its whole trajectory, start is its square on the wall
+    walker = creation_onlat.Walker_onlat(grid.size, len(bound), temp, rules_test, rng,
+                                         record_steps=timesteps if record else None, start=start)
+    inside_cnt = False
+    for i in range(1, timesteps + 1):
+        walker, inside_cnt = apply_moves(walker, kapitza, grid, prob_m_cn, inside_cnt, bound, rng=rng)
+    return walker
+
+
+def apply_bd_cond(grid, moves, cur_pos, bound, rng=np.random):
+    # choices of every boundary square are precomputed by the grid with bound applied
+    row = grid.bd_index[tuple(cur_pos)] - 1
+    # pick random choice
+    final_pos = grid.bd_neighbors[row, rng.randint(0, grid.bd_num_neighbors[row])]
+    return final_pos
+
+
+def apply_moves(walker, kapitza, grid, prob_m_cn, inside_cnt, bound, rng=np.random):
+    cur_pos = walker.cur_pos
+    moves = MOVES[len(cur_pos)]
+    jump_moves = JUMP_MOVES[len(cur_pos)]
+    inert_vol = grid.inert_vol
+    if kapitza:
+        cur_type = grid.tube_check_bd_vol[tuple(cur_pos)]  # type of square we're on
+        cur_index = grid.tube_check_index[tuple(cur_pos)] - 1  # index>0 of CNT (or 0 for not one)
+        if cur_type == 1:  # CNT end
+            final_pos, inside_cnt = kapitza_cntend(grid, moves, kapitza, cur_pos, cur_index, prob_m_cn,
+                                                   inside_cnt, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == 0:  # matrix cell
+            final_pos, inside_cnt = kapitza_matrix(grid, moves, cur_pos, cur_index, prob_m_cn, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == -1:  # CNT volume
+            final_pos, inside_cnt = kapitza_cntvol(grid, moves, kapitza, cur_pos, cur_index, prob_m_cn,
+                                                   inside_cnt, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == -1000:  # boundary
+            final_pos = apply_bd_cond(grid, moves, cur_pos, bound, rng=rng)
+            walker.add_pos(final_pos)
+        else:
+            exit()
+    elif not kapitza:  # tunneling with/without inert volume models
+        if inert_vol:
+            cur_type = grid.tube_check_bd_vol[tuple(cur_pos)]  # type of square we're on
+            cur_index = grid.tube_check_index[tuple(cur_pos)] - 1  # index>0 of CNT (or 0 for not one)
+        else:
+            cur_type = grid.tube_check_bd[tuple(cur_pos)]  # type of square we're on
+            cur_index = None
+        if cur_type == 0:  # matrix cell
+            final_pos = tunneling_matrix(grid, moves, cur_pos, cur_index, inert_vol, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == 1:  # endpoint
+            final_pos = tunneling_cntend(grid, jump_moves, cur_pos, inert_vol, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == -1000:  # boundary
+            final_pos = apply_bd_cond(grid, moves, cur_pos, bound, rng=rng)
+            walker.add_pos(final_pos)
+        elif cur_type == -1:  # CNT INERT volume
+            final_pos = tunneling_vol(grid, moves, cur_pos, cur_index, inert_vol, rng=rng)
+            walker.add_pos(final_pos)
+        else:
+            exit()
+    return walker, inside_cnt
+
+
+def kapitza_cntend(grid, moves, kapitza, cur_pos, cur_index, prob_m_cn, inside_cnt, rng=np.random):
+    choice = rng.randint(0, len(moves))
+    d_pos = np.asarray(moves[choice])
+    candidate_pos = cur_pos + d_pos
+    candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+    candidate_index = grid.tube_check_index[tuple(candidate_pos)] - 1
+    if candidate_type == -1:  # CNT volume
+        if candidate_index == cur_index:  # Same tube, send it back in
+            # move to random volume/endpoint within same CNT
+            final_pos = grid.random_tube_squares(cur_index, rng)
+            inside_cnt = True
+        else:  # NOT same tube
+            # final_pos = np.asarray(
+            #     grid.tube_squares[candidate_index][np.random.randint(0, len(grid.tube_squares[candidate_index]))])
+            # inside_cnt = True
+            random_num = rng.random()  # [0.0, 1.0)
+            enter = (random_num < prob_m_cn)
+            if enter:  # move to random volume/endpoint within new CNT
+                final_pos = grid.random_tube_squares(candidate_index, rng)
+                inside_cnt = True
+            else:  # randomize in current CNT
+                final_pos = grid.random_tube_squares(cur_index, rng)
+                inside_cnt = True
+    elif candidate_type == 1:  # CNT end
+        if candidate_index == cur_index:
+            final_pos = grid.random_tube_squares(cur_index, rng)
+            inside_cnt = True
+        else:  # hop into DIFFERENT CNT
+            final_pos = grid.random_tube_squares(candidate_index, rng)
+            inside_cnt = True
+    else:  # matrix or boundary (walk off) NO MORE TUNNELING AS OF 5_9_17 TAB
+        final_pos = candidate_pos
+        inside_cnt = False
+    return final_pos, inside_cnt
+
+
+def kapitza_matrix(grid, moves, cur_pos, cur_index, prob_m_cn, rng=np.random):
+    # generate candidate position
+    d_pos = np.asarray(moves[rng.randint(0, len(moves))])
+    candidate_pos = cur_pos + d_pos
+    candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+    candidate_idx = grid.tube_check_index[tuple(candidate_pos)] - 1
+    if candidate_type == -1:  # CNT volume
+        random_num = rng.random()  # [0.0, 1.0)
+        kap_enter = (random_num < prob_m_cn)
+        if kap_enter:
+            # move to random volume/endpoint within same CNT
+            final_pos = grid.random_tube_squares(candidate_idx, rng)
+            inside_cnt = True
+        else:
+            ### SIT
+            final_pos = cur_pos
+            inside_cnt = False
+    elif candidate_type == 1:  # CNT end
+        # move to random point within tube
+        final_pos = grid.random_tube_squares(candidate_idx, rng)
+        inside_cnt = True
+    else:  # CNT boundary or matrix
+        # move there
+        final_pos = candidate_pos
+        inside_cnt = False
+    return final_pos, inside_cnt
+
+
+def kapitza_cntvol(grid, moves, kapitza, cur_pos, cur_index, prob_m_cn, inside_cnt, rng=np.random):
+    d_pos = np.asarray(moves[rng.randint(0, len(moves))])
+    candidate_pos = cur_pos + d_pos
+    candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+    candidate_idx = grid.tube_check_index[tuple(candidate_pos)] - 1
+    if (candidate_type == 0) or (candidate_type == -1000):  # matrix or boundary
+        # Most be inside CNT, don't need to check
+        random_num = rng.random()  # [0.0, 1.0)
+        stay = (random_num > prob_m_cn)
+        if stay:  # move to random volume/endpoint within same CNT
+            final_pos = grid.random_tube_squares(cur_index, rng)
+            inside_cnt = True
+        else:  # walk outside tube
+            final_pos = np.asarray(candidate_pos)
+            inside_cnt = False
+            # final_pos = np.asarray(candidate_pos)
+            # inside_cnt = False
+    elif (candidate_type == -1) or (candidate_type == 1):  # CNT volume or end
+        if candidate_idx == cur_index:  # want to go to CNT volume in same tube
+            final_pos = grid.random_tube_squares(cur_index, rng)
+            inside_cnt = True
+        else:  # wants to enter a new tube
+            random_num = rng.random()  # [0.0, 1.0)
+            stay = (random_num > prob_m_cn)
+            if stay:  # move to random volume/endpoint within same CNT
+                final_pos = grid.random_tube_squares(cur_index, rng)
+                inside_cnt = True
+            else:  # exit to new
+                final_pos = grid.random_tube_squares(candidate_idx, rng)
+                inside_cnt = True
+    else:
+        exit()
+    return final_pos, inside_cnt
+
+
+def tunneling_vol(grid, moves, cur_pos, cur_idx, inert_vol, rng=np.random):
+    d_pos = np.asarray(moves[rng.randint(0, len(moves))])
+    candidate_pos = cur_pos + d_pos
+    if inert_vol:
+        candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+    else:
+        candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+    if candidate_type == -1:  # wants to enter volume
+        final_pos = cur_pos  # stay put
+    else:
+        final_pos = candidate_pos
+    return final_pos
+
+
+def tunneling_matrix(grid, moves, cur_pos, cur_idx, inert_vol, rng=np.random):
+    d_pos = np.asarray(moves[rng.randint(0, len(moves))])
+    candidate_pos = cur_pos + d_pos
+    if inert_vol:
+        candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+    else:
+        candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+    if candidate_type == -1:  # CNT volume
+        final_pos = cur_pos  # stay put
+    else:  # CNT boundary, matrix, end
+        final_pos = candidate_pos
+    return final_pos
+
+
+def tunneling_cntend(grid, jump_moves, cur_pos, inert_vol, rng=np.random):
+    # no CNT volume, so this rule remains unchanged from the originals (3/30/17 TB)
+    # walk off either end, 8 2D or 12 3D choices always
+    choice = rng.randint(0, len(jump_moves))
+    d_pos = np.asarray(jump_moves[choice])
+    # coord on left tube end jumps to right end
+    tube_check_val_l = grid.tube_check_l[tuple(cur_pos)]
+    # coord on right tube end jumps to left end
+    tube_check_val_r = grid.tube_check_r[tuple(cur_pos)]
+    if (tube_check_val_l > 0) and (tube_check_val_r == 0):
+        # check that pixel cannot be a left and right endpoint
+        if choice < len(jump_moves) // 2:  # stay at left end
+            candidate_pos = cur_pos + d_pos
+            if inert_vol:
+                candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+            else:
+                candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+            if candidate_type == -1:  # CNT volume
+                final_pos = cur_pos  # stay put on end
+            else:
+                final_pos = candidate_pos
+        else:  # jump across tube to right end
+            # -1 BELOW BECAUSE OF +1 OFFSET IN CREATION TO AVOID ZERO INDEX
+            candidate_pos = np.asarray(grid.tube_coords_r[tube_check_val_l - 1]) + np.asarray(d_pos)
+            if inert_vol:
+                candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+            else:
+                candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+            if candidate_type == -1:  # CNT volume
+                final_pos = cur_pos  # stay put on end
+            else:
+                final_pos = candidate_pos
+    elif (tube_check_val_r > 0) and (tube_check_val_l == 0):
+        # check that pixel cannot be a left and right endpoint
+        if choice < len(jump_moves) // 2:  # stay at right end
+            candidate_pos = cur_pos + d_pos
+            if inert_vol:
+                candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+            else:
+                candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+            if candidate_type == -1:  # CNT volume
+                final_pos = cur_pos  # stay put on end
+            else:
+                final_pos = candidate_pos
+        else:  # jump across tube to left end
+            # -1 BELOW BECAUSE OF +1 OFFSET IN CREATION TO AVOID ZERO INDEX
+            candidate_pos = np.asarray(grid.tube_coords_l[tube_check_val_r - 1]) + np.asarray(d_pos)
+            if inert_vol:
+                candidate_type = grid.tube_check_bd_vol[tuple(candidate_pos)]
+            else:
+                candidate_type = grid.tube_check_bd[tuple(candidate_pos)]
+            if candidate_type == -1:  # CNT volume
+                final_pos = cur_pos  # stay put on end
+            else:
+                final_pos = candidate_pos
+    else:
+        kill()
+    return final_pos
+
+
+
+
+def runrandomwalk_onlat_vec(grid, timesteps, pop, kapitza, prob_m_cn, bound):
+    # Advance a whole population of walkers together, one vectorized step at a time
+    table = transitions.compiled(grid, kapitza, prob_m_cn)
+    return transitions.run_population(pop, table, timesteps)
+
+
+def apply_moves_onlat_vec(pop, kapitza, grid, prob_m_cn, bound):
+    """Vectorized apply_moves. Same rules, but every walker of a transitions.Population_onlat is moved in one call
+    through the grid's precompiled transition table (compiled on first use, bound is part of the table)"""
+    table = transitions.compiled(grid, kapitza, prob_m_cn)
+    return transitions.step_population(pop, table)
+
+
+def walk_slot_onlat(grid, slot, core_time, walkers_per_timestep, kapitza, prob_m_cn, rules_test, seed, size,
+                    record=False, pair_offset=0, first_pair=None, starts='random', coupling='independent'):
+    """Walks the walkers_per_timestep pairs injected in one slot of the injection schedule for core_time steps with
+    the scalar engine. Returns their endpoint_deltas and, if record, the (hot, cold) walkers with their paths. Streams
+    are keyed by the core owning the slot in the static schedule, so any schedule gives the same walks. Pair ids start
+    at first_pair (slot * walkers_per_timestep if every slot holds as many) past pair_offset, the walkers of earlier
+    runs that were extended. starts and coupling are the wall start design and the pair coupling of
+    random_streams.pair_starts and pair_streams"""
+    dim = len(grid.bound)
+    owner = slot % size
+    if first_pair is None:
+        first_pair = slot * walkers_per_timestep
+    first_pair += pair_offset
+    hot_starts, cold_starts = random_streams.pair_starts(seed, starts, coupling,
+                                                         np.arange(first_pair, first_pair + walkers_per_timestep),
+                                                         grid.size, dim)
+    deltas = [np.zeros(0, dtype=int)]
+    pairs = []
+    for j in range(walkers_per_timestep):
+        # walker ids 2 * pair and 2 * pair + 1, any walker can be replayed from its stream
+        pair = first_pair + j
+        hot_stream, cold_stream = random_streams.pair_streams(seed, owner, pair, coupling)
+        # run trajectories for that long
+        hot_temp = runrandomwalk_onlat(grid, core_time, 'hot', kapitza, prob_m_cn, grid.bound, rules_test,
+                                       hot_stream, record=record,
+                                       start=None if hot_starts is None else hot_starts[j])
+        cold_temp = runrandomwalk_onlat(grid, core_time, 'cold', kapitza, prob_m_cn, grid.bound, rules_test,
+                                        cold_stream, record=record,
+                                        start=None if cold_starts is None else cold_starts[j])
+        if record:
+            pairs.append((hot_temp, cold_temp))
+        # get last position of walker
+        cells = np.ravel_multi_index(np.column_stack((hot_temp.cur_pos, cold_temp.cur_pos)), (grid.size + 1,) * dim)
+        deltas.append(transitions.endpoint_deltas(cells, np.asarray([1, -1])))
+    return np.concatenate(deltas), pairs
+
+
+def walk_batch_onlat(grid, table, slots, slot_times, slot_pairs, rules_test, seed, pair_offset=0, starts='random',
+                     coupling='independent'):
+    """endpoint_deltas of the pairs of slots walked with the vectorized engine as one transitions.run_batch, each
+    for the core time of its slot. Walker 2 * pair (and 2 * pair + 1 for an independent cold walker) draws from the
+    counter stream of its id, so the walks do not depend on how slots are batched"""
+    dim = len(grid.bound)
+    slots = np.asarray(slots, dtype=int)
+    if len(slots) == 0:
+        return np.zeros(0, dtype=int)
+    num_pairs = slot_pairs[slots + 1] - slot_pairs[slots]
+    pairs = pair_offset + np.concatenate([np.arange(slot_pairs[slot], slot_pairs[slot + 1]) for slot in slots])
+    steps = np.repeat(slot_times[slots], num_pairs)
+    if coupling == 'independent':
+        cold_ids = 2 * pairs + 1
+    elif coupling == 'common':
+        cold_ids = 2 * pairs  # replays the hot walker's stream
+    else:
+        logging.error('Invalid pair coupling %s' % coupling)
+        raise SystemExit
+    hot_key = random_streams.walker_keys(seed, 2 * pairs)
+    cold_key = random_streams.walker_keys(seed, cold_ids)
+    hot_starts, cold_starts = random_streams.pair_starts(seed, starts, coupling, pairs, grid.size, dim)
+    if hot_starts is None or rules_test:
+        hot_starts = random_streams.counter_wall_starts(hot_key, grid.size, dim)
+        cold_starts = random_streams.counter_wall_starts(cold_key, grid.size, dim)
+    if rules_test:
+        # anywhere on the grid, all counted as hot
+        hot_x = (random_streams.counter_uniforms(hot_key, random_streams.START_DRAW) * (grid.size + 1)).astype(int)
+        cold_x = (random_streams.counter_uniforms(cold_key, random_streams.START_DRAW) * (grid.size + 1)).astype(int)
+        sign = np.ones(2 * len(pairs), dtype=int)
+    else:
+        hot_x = np.zeros(len(pairs), dtype=int)
+        cold_x = hot_x + grid.size
+        sign = np.concatenate((np.ones(len(pairs), dtype=int), -np.ones(len(pairs), dtype=int)))
+    shape = (grid.size + 1,) * dim
+    cell = np.concatenate((np.ravel_multi_index([hot_x] + list(np.asarray(hot_starts).T), shape),
+                           np.ravel_multi_index([cold_x] + list(np.asarray(cold_starts).T), shape)))
+    cell = transitions.run_batch(table, cell, np.concatenate((hot_key, cold_key)), np.concatenate((steps, steps)))
+    return transitions.endpoint_deltas(cell, sign)
+
+
+def slot_groups(slots, slot_times, slot_pairs, num_groups):
+    """slots cut into at most num_groups runs of whole slots with about the same walker steps each"""
+    slots = np.asarray(slots, dtype=int)
+    work = np.cumsum((slot_pairs[slots + 1] - slot_pairs[slots]) * np.maximum(slot_times[slots], 1))
+    if len(slots) == 0:
+        return []
+    cuts = np.searchsorted(work, work[-1] * np.arange(1, num_groups) / num_groups, side='right')
+    return [group for group in np.split(slots, np.unique(cuts)) if len(group) > 0]
+
+
+def walk_slots_onlat(grid, engine, slots, slot_times, slot_pairs, kapitza, prob_m_cn, rules_test, seed, size,
+                     record=False, pair_offset=0, threads=1, thread_pool=None, starts='random',
+                     coupling='independent'):
+    """Walks the pairs of every slot in slots for the core time slot_times[slot] of its slot, slot s holding pairs
+    slot_pairs[s] ... slot_pairs[s + 1] - 1 as scheduler.injection_slots has them. Returns their endpoint_deltas and
+    the walkers with their paths of every slot if record (scalar engine only). The vectorized engine walks all of
+    them together with walk_batch_onlat, with a thread_pool split into threads groups of whole slots"""
+    slot_times = np.asarray(slot_times)
+    slot_pairs = np.asarray(slot_pairs)
+    deltas = [np.zeros(0, dtype=int)]
+    paths = {}
+    if engine == 'vectorized':
+        table = transitions.compiled(grid, kapitza, prob_m_cn)
+        groups = slot_groups(slots, slot_times, slot_pairs, threads if thread_pool is not None else 1)
+        batch_args = [(grid, table, group, slot_times, slot_pairs, rules_test, seed, pair_offset, starts, coupling)
+                      for group in groups]
+        if thread_pool is None or len(groups) < 2:
+            deltas.extend(walk_batch_onlat(*args) for args in batch_args)
+        else:
+            # a step is mostly NumPy calls that release the GIL, so the threads walk in parallel
+            running = [thread_pool.submit(walk_batch_onlat, *args) for args in batch_args]
+            deltas.extend(result.result() for result in running)
+        return np.concatenate(deltas), paths
+    for slot in slots:
+        num_pairs = slot_pairs[slot + 1] - slot_pairs[slot]
+        slot_deltas, paths[slot] = walk_slot_onlat(grid, slot, slot_times[slot], num_pairs, kapitza, prob_m_cn,
+                                                   rules_test, seed, size, record, pair_offset, slot_pairs[slot],
+                                                   starts, coupling)
+        deltas.append(slot_deltas)
+    return np.concatenate(deltas), paths
@@ -0,0 +1,144 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+
+"""scheduler.py
+CONDUCTION package
+
+Dynamic master/worker scheduling of the constant flux walks. The d_add schedule is cut into slots, one injection
+timestep each, and the slots between checkpoints into batches. Core 0 hands batches out from a queue and takes back
+the endpoint deltas, so cores that finish early pull more work instead of idling on walkers that got stuck in tube
+networks elsewhere. Every worker holds a few batches ahead, so the analysis on core 0 between results never stalls
+them. Any number of walker pairs is spread over the timesteps, so slots may hold different numbers of pairs and need
+not divide evenly between the cores."""
+
+import numpy as np
+from mpi4py import MPI
+
+WORK_TAG = 1
+RESULT_TAG = 2
+
+
+def injection_times(num_pairs, tot_time):
+    """Timestep each of num_pairs hot/cold walker pairs is injected at, spread evenly over tot_time timesteps.
+    Pair p goes in at p * tot_time // num_pairs, the d_add schedule when either divides the other"""
+    return (np.arange(num_pairs, dtype=np.int64) * tot_time) // num_pairs
+
+
+def injection_slots(num_pairs, tot_time):
+    """Cuts the injection schedule into slots, one per injection timestep. Returns the timestep of every slot and
+    slot_pairs, the first pair of every slot with num_pairs appended. Slot s holds pairs slot_pairs[s] ...
+    slot_pairs[s + 1] - 1"""
+    inject_times = injection_times(num_pairs, tot_time)
+    slot_pairs = np.flatnonzero(np.concatenate(([True], inject_times[1:] != inject_times[:-1])))
+    return inject_times[slot_pairs], np.append(slot_pairs, num_pairs)
+
+
+def slot_batches(slot_times, printout_inc, pieces=1, first_slot=0):
+    """Cuts slots first_slot ... into batches of consecutive slots that are walked together. A batch never runs past
+    a checkpoint, the last slot before the injection time reaches the next multiple of printout_inc, and the slots
+    between two checkpoints are split into up to pieces batches of about as many slots. Returns the first slot of
+    every batch with the number of slots appended, batch b holds slots batches[b] ... batches[b + 1] - 1"""
+    slot_times = np.asarray(slot_times)
+    num_slots = len(slot_times)
+    after_checkpoint = np.flatnonzero(slot_times[1:] // printout_inc > slot_times[:-1] // printout_inc) + 1
+    bounds = np.unique(np.concatenate(([first_slot], after_checkpoint[after_checkpoint > first_slot], [num_slots])))
+    batches = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        batches.extend(np.linspace(lo, hi, min(pieces, hi - lo) + 1).astype(int)[:-1])
+    return np.append(np.asarray(batches, dtype=int), num_slots)
+
+
+def master_results(comm, num_slots, prefetch=2, first_slot=0):
+    """Runs on core 0. Hands work items first_slot ... num_slots - 1, slots or batches of them, to the other cores and
+    yields (item, result) in order. Closing it early, e.g. once k has converged, stops the workers after the items
+    they already hold"""
+    status = MPI.Status()
+    workers = list(range(1, comm.Get_size()))
+    outstanding = dict((worker, 0) for worker in workers)
+    next_slot = first_slot
+    for n in range(prefetch):
+        for worker in workers:
+            if next_slot < num_slots:
+                comm.send(next_slot, dest=worker, tag=WORK_TAG)
+                outstanding[worker] += 1
+                next_slot += 1
+    for worker in workers:
+        if outstanding[worker] == 0:
+            comm.send(None, dest=worker, tag=WORK_TAG)
+    done = {}  # results that came back ahead of an earlier slot
+    next_yield = first_slot
+    try:
+        while next_yield < num_slots:
+            slot, result = comm.recv(source=MPI.ANY_SOURCE, tag=RESULT_TAG, status=status)
+            worker = status.Get_source()
+            outstanding[worker] -= 1
+            # refill before yielding, the worker keeps going while core 0 analyses
+            if next_slot < num_slots:
+                comm.send(next_slot, dest=worker, tag=WORK_TAG)
+                outstanding[worker] += 1
+                next_slot += 1
+            elif outstanding[worker] == 0:
+                comm.send(None, dest=worker, tag=WORK_TAG)
+            done[slot] = result
+            while next_yield in done:
+                yield next_yield, done.pop(next_yield)
+                next_yield += 1
+    finally:
+        # closed early, hand out nothing more and drop the results of slots the workers still hold
+        while sum(outstanding.values()) > 0:
+            comm.recv(source=MPI.ANY_SOURCE, tag=RESULT_TAG, status=status)
+            worker = status.Get_source()
+            outstanding[worker] -= 1
+            if outstanding[worker] == 0:
+                comm.send(None, dest=worker, tag=WORK_TAG)
+
+
+def worker_slots(comm):
+    """Runs on every other core. Yields the slots or batches handed out by core 0 until the queue is empty"""
+    while True:
+        slot = comm.recv(source=0, tag=WORK_TAG)
+        if slot is None:
+            return
+        yield slot
+
+
+def return_result(comm, slot, result):
+    """Sends the result of a finished slot or batch back to core 0"""
+    comm.send((slot, result), dest=0, tag=RESULT_TAG)
+
+
+class StopSignal(object):
+    """Core 0's decision to stop early, e.g. once k has converged, sent to every core with a non blocking broadcast.
+    Every core posts at the same checkpoints and checks at the next one, so nobody waits on core 0's analysis and all
+    cores stop after the same checkpoint. The price is latency: core 0 analyses a checkpoint only once the next one
+    is in flight and posts right away, but the cores see the stop at the checkpoint after that. So a run stops two
+    checkpoints (2 * printout_inc timesteps of injection) after the one k converged at"""
+    def __init__(self, comm):
+        self.comm = comm
+        self.flag = np.zeros(1, dtype=int)
+        self.request = None
+
+    def post(self, stop=False):
+        """Broadcasts stop from core 0, the other cores receive into flag"""
+        if self.request is None:
+            self.flag = np.array([int(stop)])
+            self.request = self.comm.Ibcast(self.flag, root=0)
+
+    def stopped(self):
+        """Whether core 0 posted a stop at the last checkpoint"""
+        if self.request is not None:
+            self.request.Wait()
+            self.request = None
+        return bool(self.flag[0])
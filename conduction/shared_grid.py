@@ -0,0 +1,98 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+
+"""shared_grid.py
+CONDUCTION package
+
+Hands the grid, and its compiled transition table, from core 0 to every core through MPI-3 shared memory. Only the
+small part of the grid (tube lists, parameters) is pickled and broadcast. Every NumPy array goes into one shared
+window per node, filled once by the node leader with a buffer Bcast, and the cores of the node map it read only.
+Memory for the grid no longer grows with the number of cores per node. Alternatively every core rebuilds the grid from
+the run seed and only a hash is compared."""
+
+import hashlib
+import logging
+import numpy as np
+from mpi4py import MPI
+
+
+def share_grid(grid, comm):
+    """grid on core 0 (None elsewhere) -> the same grid on every core, its arrays read only views of node memory"""
+    return share_object(grid, comm)
+
+
+def share_object(obj, comm):
+    """share_grid for any object with __getstate__/__setstate__, e.g. the grid's transitions.TransitionTable"""
+    rank = comm.Get_rank()
+    node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=rank)
+    # one leader per node, core 0 leads its own node
+    leader_comm = comm.Split(0 if node_comm.Get_rank() == 0 else MPI.UNDEFINED, key=rank)
+    if rank == 0:
+        state = obj.__getstate__()
+        arrays = dict((name, value) for name, value in state.items() if isinstance(value, np.ndarray))
+        small_state = dict((name, value) for name, value in state.items() if name not in arrays)
+        layout = [(name, arrays[name].shape, arrays[name].dtype.str) for name in sorted(arrays)]
+        obj_class = type(obj)
+    else:
+        small_state = layout = obj_class = None
+    obj_class, small_state, layout = comm.bcast((obj_class, small_state, layout), root=0)
+
+    windows = []
+    for name, shape, dtype in layout:
+        dtype = np.dtype(dtype)
+        num_bytes = int(np.prod(shape)) * dtype.itemsize if node_comm.Get_rank() == 0 else 0
+        win = MPI.Win.Allocate_shared(num_bytes, dtype.itemsize, comm=node_comm)
+        buf, itemsize = win.Shared_query(0)
+        array = np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+        if rank == 0:
+            array[...] = arrays[name]
+        if leader_comm != MPI.COMM_NULL:
+            leader_comm.Bcast(array, root=0)
+        small_state[name] = array
+        windows.append(win)
+    node_comm.Barrier()  # leaders are done writing
+    for name, shape, dtype in layout:
+        small_state[name].flags.writeable = False
+
+    shared = obj_class.__new__(obj_class)
+    shared.__setstate__(small_state)
+    shared.shared_windows = windows  # keep the node memory alive as long as the object
+    if leader_comm != MPI.COMM_NULL:
+        leader_comm.Free()
+    node_comm.Free()
+    return shared
+
+
+def grid_hash(grid):
+    """64 bit digest of every array of the grid, cheap to compare between cores"""
+    state = grid.__getstate__()
+    digest = hashlib.sha1()
+    for name in sorted(state):
+        value = state[name]
+        if isinstance(value, np.ndarray):
+            digest.update(('%s %s %s' % (name, value.shape, value.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+    return int(np.frombuffer(digest.digest()[:8], dtype=np.int64)[0])
+
+
+def regenerated_grid(grid, comm):
+    """grid built from the same seed on every core -> grid, checked against core 0 by hash. If any core built a
+    different grid, the grid of core 0 is shared instead"""
+    local_hash = grid_hash(grid)
+    if comm.allreduce(local_hash, op=MPI.MIN) == comm.allreduce(local_hash, op=MPI.MAX):
+        return grid
+    if comm.Get_rank() == 0:
+        logging.warning('Regenerated grids differ between cores, sharing the grid of core 0')
+    return share_grid(grid if comm.Get_rank() == 0 else None, comm)
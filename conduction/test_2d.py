@@ -28,6 +28,7 @@ from conduction import creation_2d
 from conduction import plots
 from conduction import analysis
 from conduction import rules_2d
+from conduction import shared_grid
 
 
 def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation, tot_time, quiet, plot_save_dir,
@@ -63,7 +64,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         grid = None
 
     comm.Barrier()
-    grid = comm.bcast(grid, root=0)
+    grid = shared_grid.share_grid(grid, comm)
 
     bins = grid.size + 1
 
@@ -89,7 +90,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         cur_num_walkers = i * size
         H_master = np.zeros((grid.size + 1, grid.size + 1), dtype=float)  # should be reset every iteration
         walker_temp = rules_2d.runrandomwalk_2d_onlat(grid, tot_time, 'hot', kapitza, prob_m_cn, grid.bound,
-                                                      rules_test)  # 'hot' since +1
+                                                      rules_test, record=True)  # 'hot' since +1
         # histogram ALL positions
         for j in range(len(walker_temp.pos)):
             H_local[walker_temp.pos[j][0], walker_temp.pos[j][1]] += 1.0
@@ -114,7 +115,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         cur_num_walkers = walkers_per_core_whole * size + walkers_per_core_remain
         H_master = np.zeros((grid.size + 1, grid.size + 1), dtype=float)  # should be reset every iteration
         walker_temp = rules_2d.runrandomwalk_2d_onlat(grid, tot_time, 'hot', kapitza, prob_m_cn, grid.bound,
-                                                      rules_test)  # 'hot' since +1
+                                                      rules_test, record=True)  # 'hot' since +1
         # histogram ALL positions
         for j in range(len(walker_temp.pos)):
             H_local[walker_temp.pos[j][0], walker_temp.pos[j][1]] += 1.0
@@ -28,6 +28,7 @@ from conduction import creation_3d
 from conduction import plots
 from conduction import rules_3d
 from conduction import analysis
+from conduction import shared_grid
 
 
 def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation, tot_time, quiet, plot_save_dir,
@@ -51,7 +52,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         grid = None
 
     comm.Barrier()
-    grid = comm.bcast(grid, root=0)
+    grid = shared_grid.share_grid(grid, comm)
 
     bins = grid.size + 1
 
@@ -79,7 +80,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         H_master = np.zeros((grid.size + 1, grid.size + 1, grid.size + 1),
                             dtype=float)  # should be reset every iteration
         walker_temp = rules_3d.runrandomwalk_3d_onlat(grid, tot_time, 'hot', kapitza, prob_m_cn, grid.bound,
-                                                      rules_test)  # 'hot' since +1
+                                                      rules_test, record=True)  # 'hot' since +1
         # histogram ALL positions
         for j in range(len(walker_temp.pos)):
             H_local[walker_temp.pos[j][0], walker_temp.pos[j][1], walker_temp.pos[j][2]] += 1.0
@@ -105,7 +106,7 @@ def parallel_method(grid_size, tube_length, tube_radius, num_tubes, orientation,
         H_master = np.zeros((grid.size + 1, grid.size + 1, grid.size + 1),
                             dtype=float)  # should be reset every iteration
         walker_temp = rules_3d.runrandomwalk_3d_onlat(grid, tot_time, 'hot', kapitza, prob_m_cn, grid.bound,
-                                                      rules_test)  # 'hot' since +1
+                                                      rules_test, record=True)  # 'hot' since +1
         # histogram ALL positions
         for j in range(len(walker_temp.pos)):
             H_local[walker_temp.pos[j][0], walker_temp.pos[j][1], walker_temp.pos[j][2]] += 1.0
@@ -0,0 +1,346 @@
+# //////////////////////////////////////////////////////////////////////////////////// #
+# ////////////////////////////// ##  ##  ###  ## ### ### ///////////////////////////// #
+# ////////////////////////////// # # # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// ##  ##   #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #  #   # #  #  ///////////////////////////// #
+# ////////////////////////////// #   # #  #   ## # #  #  ///////////////////////////// #
+# ////////////////////////////// ###  #          ##           # ///////////////////////#
+# //////////////////////////////  #      ###     # # # # ### ### ///////////////////// #
+# //////////////////////////////  #   #  ###     ##  # # #    # ////////////////////// #
+# //////////////////////////////  #   ## # #     # # ### #    ## ///////////////////// #
+# //////////////////////////////  #              ## ////////////////////////////////// #
+# //////////////////////////////////////////////////////////////////////////////////// #
+
+
+"""transitions.py
+CONDUCTION package
+
+Precompiled per-square transition tables. The walk rules in rules_onlat only depend on the square a walker
+is on and the move choice it draws, so every square/choice is resolved once after grid creation into a destination
+(or "uniform over tube k") and an acceptance probability. A step is then one random choice plus one table lookup."""
+
+from __future__ import division
+import logging
+import numpy as np
+
+from conduction import random_streams
+
+
+def grid_moves(dim):
+    """Same moves and order as moves_2d/moves_3d in the rules"""
+    moves = np.eye(dim, dtype=int)[::-1]
+    return np.concatenate((moves, -moves))
+
+
+def transition_outcomes(grid, kapitza, prob_m_cn):
+    """Enumerates the rules for every square and every move choice.
+    A choice ends on outcome a with probability prob_a, otherwise on outcome b. Outcomes >= 0 are raveled squares,
+    outcomes < 0 mean a uniform random volume/endpoint square of tube -(outcome + 1).
+    Only the first num_choices[square] choices are used, each picked with equal probability."""
+    dim = len(grid.bound)
+    shape = (grid.size + 1,) * dim
+    moves = grid_moves(dim)
+    num_moves = len(moves)
+    if kapitza:
+        check = grid.tube_check_bd_vol
+        width = num_moves
+    else:
+        if grid.inert_vol:
+            check = grid.tube_check_bd_vol
+        else:
+            check = grid.tube_check_bd
+        width = 2 * num_moves  # walk off either end of a tube
+    cur_pos = np.indices(shape).reshape(dim, -1).T
+    cur = np.ravel_multi_index(cur_pos.T, shape)
+    cur_type = check.ravel()
+    cur_index = grid.tube_check_index.ravel() - 1
+    bd = (cur_type == -1000)
+    bd_row = grid.bd_index.ravel()[bd] - 1
+    if not np.all(bd | (cur_type == 0) | (cur_type == 1) | (cur_type == -1)):
+        logging.error('Square of unknown type found in check array')
+        raise SystemExit
+    num = len(cur)
+    valid = np.zeros((num, width), dtype=bool)
+    dest_a = np.zeros((num, width), dtype=int)
+    dest_b = np.zeros((num, width), dtype=int)
+    prob_a = np.ones((num, width), dtype=float)
+    if not kapitza:
+        end = (cur_type == 1)
+        tube_check_val_l = grid.tube_check_l.ravel()
+        tube_check_val_r = grid.tube_check_r.ravel()
+        if np.any(end & ((tube_check_val_l > 0) == (tube_check_val_r > 0))):
+            logging.error('Invalid random walk rule. Check rules.')
+            raise SystemExit
+        other_end = np.zeros_like(cur_pos)
+        if np.any(end):
+            # -1 BELOW BECAUSE OF +1 OFFSET IN CREATION TO AVOID ZERO INDEX
+            other_end[end] = np.where((tube_check_val_l[end] > 0)[:, None],
+                                      np.asarray(grid.tube_coords_r)[tube_check_val_l[end] - 1],
+                                      np.asarray(grid.tube_coords_l)[tube_check_val_r[end] - 1])
+    for choice in range(width):
+        move = moves[choice % num_moves]
+        if choice < num_moves:
+            base_pos = cur_pos
+            used = np.ones(num, dtype=bool)
+        else:  # jump across tube to the other end
+            base_pos = other_end
+            used = end
+        candidate_pos = base_pos + move
+        # boundary squares step through the grid's neighbor table, which already holds the bound
+        if choice < num_moves:
+            candidate_pos[bd] = grid.bd_neighbors[bd_row, choice]
+            used[bd] = (choice < grid.bd_num_neighbors[bd_row])
+        candidate_pos[~used] = cur_pos[~used]
+        candidate = np.ravel_multi_index(candidate_pos.T, shape)
+        candidate_type = cur_type[candidate]
+        candidate_index = cur_index[candidate]
+        a = candidate.copy()
+        b = candidate.copy()
+        p = np.ones(num, dtype=float)
+        if kapitza:
+            candidate_cnt = (candidate_type == -1) | (candidate_type == 1)
+            same_tube = (candidate_index == cur_index)
+            cur_tube = -(cur_index + 1)
+            candidate_tube = -(candidate_index + 1)
+            # CNT end
+            mask = (cur_type == 1) & candidate_cnt
+            a[mask] = np.where(same_tube, cur_tube, candidate_tube)[mask]
+            b[mask] = np.where(same_tube | (candidate_type == 1), a, cur_tube)[mask]
+            p[mask & ~same_tube & (candidate_type == -1)] = prob_m_cn
+            # matrix cell
+            mask = (cur_type == 0) & (candidate_type == 1)
+            a[mask] = candidate_tube[mask]
+            b[mask] = candidate_tube[mask]
+            mask = (cur_type == 0) & (candidate_type == -1)
+            a[mask] = candidate_tube[mask]
+            b[mask] = cur[mask]  # SIT
+            p[mask] = prob_m_cn
+            # CNT volume
+            mask = (cur_type == -1) & ~candidate_cnt
+            b[mask] = cur_tube[mask]
+            p[mask] = prob_m_cn
+            mask = (cur_type == -1) & candidate_cnt
+            a[mask] = np.where(same_tube, cur_tube, candidate_tube)[mask]
+            b[mask] = cur_tube[mask]
+            p[mask & same_tube] = 1.0
+            p[mask & ~same_tube] = prob_m_cn
+        else:
+            blocked = (candidate_type == -1)  # CNT volume, stay put
+            a[blocked] = cur[blocked]
+            b[blocked] = cur[blocked]
+        # boundary squares always move to their candidate
+        a[bd] = candidate[bd]
+        b[bd] = candidate[bd]
+        p[bd] = 1.0
+        valid[:, choice] = used
+        dest_a[:, choice] = a
+        dest_b[:, choice] = b
+        prob_a[:, choice] = p
+    # move the valid choices of every square to the front
+    order = np.argsort(~valid, axis=1, kind='stable')
+    rows = np.arange(num)[:, None]
+    num_choices = np.sum(valid, axis=1)
+    return num_choices, dest_a[rows, order], dest_b[rows, order], prob_a[rows, order]
+
+
+def tube_squares_raveled(grid):
+    """Raveled volume/endpoint squares of every tube in the grid's CSR layout, (flat, offsets, lengths)"""
+    dim = len(grid.bound)
+    shape = (grid.size + 1,) * dim
+    if not hasattr(grid, 'tube_squares_flat'):  # no tube volume
+        return np.zeros(0, dtype=int), np.zeros(1, dtype=int), np.zeros(0, dtype=int)
+    flat = np.ravel_multi_index(grid.tube_squares_flat.T, shape)
+    return flat, grid.tube_squares_offsets, grid.tube_squares_len
+
+
+class TransitionTable(object):
+    def __init__(self, grid, kapitza, prob_m_cn):
+        """Walk rules of grid compiled into tables over raveled squares.
+        Choice c of square i (c < num_choices[i]) goes to dest_a[i, c] with probability prob_m_cn if
+        partial[i, c] (else always), otherwise to dest_b[i, c]. Negative destinations -(k + 1) are a uniform
+        volume/endpoint square of tube k."""
+        self.dim = len(grid.bound)
+        self.shape = (grid.size + 1,) * self.dim
+        self.kapitza = kapitza
+        self.prob_m_cn = prob_m_cn
+        self.bound = list(grid.bound)
+        num_choices, dest_a, dest_b, prob_a = transition_outcomes(grid, kapitza, prob_m_cn)
+        # compact dtypes, 3D grids have ~1e6 squares
+        self.num_choices = num_choices.astype(np.int8)
+        self.dest_a = dest_a.astype(np.int32)
+        self.dest_b = dest_b.astype(np.int32)
+        self.partial = (prob_a != 1.0)  # the only other acceptance probability is prob_m_cn
+        self.boundary = (grid.tube_check_bd_vol.ravel() == -1000)
+        self.tube_squares, self.tube_offsets, self.tube_len = tube_squares_raveled(grid)
+
+    def __getstate__(self):
+        """Shared memory windows/blocks belong to the processes of one node and are not pickled"""
+        state = self.__dict__.copy()
+        state.pop('shared_windows', None)
+        state.pop('shared_blocks', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def matches(self, grid, kapitza, prob_m_cn):
+        return (self.shape == (grid.size + 1,) * len(grid.bound)) and (self.kapitza == kapitza) \
+            and (self.prob_m_cn == prob_m_cn) and (self.bound == list(grid.bound))
+
+    def squares_of_tube(self, tube_idx):
+        """Raveled volume/endpoint squares of tube tube_idx"""
+        return self.tube_squares[self.tube_offsets[tube_idx]:self.tube_offsets[tube_idx + 1]]
+
+    def random_tube_squares(self, tube_idx, rng=np.random):
+        """Uniform random volume/endpoint square within each tube of tube_idx"""
+        pick = self.tube_offsets[tube_idx] + (rng.random(len(tube_idx)) * self.tube_len[tube_idx]).astype(int)
+        return self.tube_squares[pick]
+
+    def step(self, cur, rng=np.random):
+        """One step for every walker on raveled squares cur. Returns the new squares and which walkers were
+        relocated within a tube. rng may be the random_streams.CounterStreams of the walkers"""
+        num = len(cur)
+        choice = (rng.random(num) * self.num_choices[cur]).astype(int)
+        accept = ~self.partial[cur, choice] | (rng.random(num) < self.prob_m_cn)
+        final = np.where(accept, self.dest_a[cur, choice], self.dest_b[cur, choice]).astype(int)
+        relocate = (final < 0)
+        if np.any(relocate):
+            if isinstance(rng, random_streams.CounterStreams):
+                final[relocate] = self.random_tube_squares(-final[relocate] - 1, rng.subset(relocate))
+            else:
+                final[relocate] = self.random_tube_squares(-final[relocate] - 1, rng)
+        return final, relocate
+
+    def prob_a(self):
+        """Acceptance probability of dest_a for every square and choice"""
+        return np.where(self.partial, self.prob_m_cn, 1.0)
+
+
+def compiled(grid, kapitza, prob_m_cn):
+    """Transition table of grid, compiled on first use and whenever the walk model changes"""
+    table = getattr(grid, 'transitions', None)
+    if (table is None) or not table.matches(grid, kapitza, prob_m_cn):
+        table = grid.compile_transitions(kapitza, prob_m_cn)
+    return table
+
+
+class Population_onlat(object):
+    def __init__(self, grid_size, dim, rules_test, rng=np.random):
+        """Struct-of-arrays population of walkers in any dimension, advanced all at once by step_population.
+        cell holds the raveled square of each walker, sign is +1 for hot and -1 for cold walkers.
+        Every draw of the population comes from rng, np.random or a random_streams.RandomStream."""
+        self.size = grid_size
+        self.dim = dim
+        self.shape = (grid_size + 1,) * dim
+        self.rules_test = rules_test
+        self.rng = rng
+        self.cell = np.zeros(0, dtype=int)
+        self.inside_cnt = np.zeros(0, dtype=bool)
+        self.sign = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        return len(self.sign)
+
+    @property
+    def pos(self):
+        """[x, y(, z)] per walker"""
+        return np.column_stack(np.unravel_index(self.cell, self.shape)).reshape(len(self), self.dim)
+
+    def add_walkers(self, temp, num_walkers, start=None):
+        """Adds num_walkers new walkers on the hot or cold wall, same start rules as the single walkers. start
+        holds their squares on the wall, num_walkers x (dim - 1), drawn if not given"""
+        if not self.rules_test:
+            if temp == 'hot':
+                start_x = np.zeros(num_walkers, dtype=int)
+                sign = 1
+            elif temp == 'cold':
+                start_x = np.zeros(num_walkers, dtype=int) + self.size
+                sign = -1
+            else:
+                logging.error('Invalid walker temperature')
+                raise SystemExit
+        else:
+            start_x = self.rng.randint(0, self.size + 1, num_walkers)
+            sign = 1
+        if start is None or self.rules_test:
+            start = [start_x] + [self.rng.randint(0, self.size + 1, num_walkers) for j in range(1, self.dim)]
+        else:
+            start = [start_x] + list(np.asarray(start, dtype=int).reshape(num_walkers, self.dim - 1).T)
+        self.cell = np.concatenate((self.cell, np.ravel_multi_index(start, self.shape)))
+        self.inside_cnt = np.concatenate((self.inside_cnt, np.zeros(num_walkers, dtype=bool)))
+        self.sign = np.concatenate((self.sign, np.zeros(num_walkers, dtype=int) + sign))
+
+    def histogram(self):
+        """Signed histogram of the walker positions over the grid"""
+        H = np.zeros(int(np.prod(self.shape)), dtype=int)
+        np.add.at(H, self.cell, self.sign)
+        return H.reshape(self.shape)
+
+
+def endpoint_deltas(cell, sign):
+    """Walker endpoints as one int per walker, sign * (raveled square + 1). Used to send histogram updates
+    instead of whole histograms"""
+    return sign * (np.asarray(cell) + 1)
+
+
+def add_endpoint_deltas(H, deltas):
+    """Histogram endpoint_deltas into H in place"""
+    np.add.at(H.reshape(-1), np.abs(deltas) - 1, np.sign(deltas))
+
+
+def histogram_bins(shape, bin_size):
+    """Cells per bin along each axis of a histogram of shape kept at bin_size cells per side, 0 for a single bin"""
+    if bin_size == 0:
+        return tuple(shape)
+    return (bin_size,) * len(shape)
+
+
+def binned_shape(shape, bins):
+    """Shape of a histogram of shape binned bins cells per bin along each axis"""
+    return tuple(-(-s // b) for s, b in zip(shape, bins))
+
+
+def binned_deltas(deltas, shape, bins):
+    """endpoint_deltas of a histogram of shape re-encoded for the histogram binned bins cells per bin along each
+    axis. A bin spanning a whole axis sums over it, e.g. (1, 1, size) gives the 3D histogram collapsed over z"""
+    if all(b == 1 for b in bins):
+        return deltas
+    deltas = np.asarray(deltas)
+    cells = np.unravel_index(np.abs(deltas) - 1, shape)
+    binned = tuple(c // b for c, b in zip(cells, bins))
+    return np.sign(deltas) * (np.ravel_multi_index(binned, binned_shape(shape, bins)) + 1)
+
+
+def step_population(pop, table):
+    """Advance every walker of a population one step with a compiled table. Walkers stay on raveled squares,
+    so 2D and 3D share this path"""
+    if len(pop) == 0:
+        return pop
+    final, relocate = table.step(pop.cell, pop.rng)
+    pop.inside_cnt = np.where(table.boundary[pop.cell], pop.inside_cnt, relocate)
+    pop.cell = final
+    return pop
+
+
+def run_population(pop, table, timesteps):
+    """Advance a whole population timesteps steps"""
+    for i in range(timesteps):
+        pop = step_population(pop, table)
+    return pop
+
+
+def run_batch(table, cell, key, steps):
+    """Walks the walkers on raveled squares cell steps[j] steps each, walker j drawing from the counter stream of
+    key[j]. Walkers are sorted longest walk first, so the ones still walking at any step are a prefix and every step
+    is one TransitionTable.step. Returns the final squares"""
+    order = np.argsort(-np.asarray(steps), kind='stable')
+    cell = np.asarray(cell)[order]
+    key = np.asarray(key)[order]
+    # walkers with more than t steps, for every step t
+    walking = np.searchsorted(-np.asarray(steps)[order], -np.arange(np.max(steps, initial=0)), side='left')
+    for t, num in enumerate(walking):
+        streams = random_streams.CounterStreams(key[:num], t)
+        cell[:num], relocate = table.step(cell[:num], streams)
+    final = np.empty_like(cell)
+    final[order] = cell
+    return final
@@ -0,0 +1,45 @@
+"""test_analysis.py
+CONDUCTION package
+
+ProfileFit kept up to date from endpoint deltas against check_convergence_2d/3d_onlat, the stats.linregress fit of
+the full histogram."""
+
+from __future__ import division
+import numpy as np
+
+from conduction import analysis
+from conduction import transitions
+
+
+def random_deltas(grid_size, dim, num, seed):
+    """endpoint_deltas of num walkers on random squares, hot walkers nearer x = 0 so there is a slope"""
+    rng = np.random.RandomState(seed)
+    shape = (grid_size + 1,) * dim
+    sign = np.where(rng.random_sample(num) < 0.5, 1, -1)
+    x = np.clip((rng.triangular(0, 0, 1, num) * (grid_size + 1)).astype(int), 0, grid_size)
+    x = np.where(sign > 0, x, grid_size - x)
+    rest = [rng.randint(0, grid_size + 1, num) for j in range(1, dim)]
+    return transitions.endpoint_deltas(np.ravel_multi_index([x] + rest, shape), sign)
+
+
+def test_profile_fit_matches_linregress():
+    grid_size = 40
+    timesteps = 500
+    for dim in (2, 3):
+        shape = (grid_size + 1,) * dim
+        H = np.zeros(shape, dtype=int)
+        fit = analysis.ProfileFit(grid_size, dim)
+        num_walkers = 0
+        for seed in range(5):
+            deltas = random_deltas(grid_size, dim, 20000, seed)
+            transitions.add_endpoint_deltas(H, deltas)
+            fit.add_deltas(deltas)
+            num_walkers += len(deltas)
+            if dim == 2:
+                expected = analysis.check_convergence_2d_onlat(H, num_walkers, grid_size, timesteps)
+            else:
+                expected = analysis.check_convergence_3d_onlat(H, num_walkers, grid_size, timesteps)[:6]
+            assert np.allclose(fit.fit(num_walkers, timesteps), expected, rtol=1e-9, atol=0.0)
+            # restored from the full histogram, as after a restart
+            restored = analysis.ProfileFit(grid_size, dim, H)
+            assert np.allclose(restored.fit(num_walkers, timesteps), expected, rtol=1e-9, atol=0.0)
@@ -0,0 +1,57 @@
+"""test_blocking.py
+CONDUCTION package
+
+Blocking error of the mean against the known one of an AR(1) series, and the k values a restart blocks."""
+
+from __future__ import division
+import numpy as np
+
+from conduction import analysis
+from conduction import blocking
+
+
+def ar1_series(phi, n, seed):
+    rng = np.random.RandomState(seed)
+    noise = rng.normal(size=n)
+    x = np.empty(n)
+    x[0] = noise[0] / np.sqrt(1.0 - phi ** 2)  # start in the stationary distribution
+    for i in range(1, n):
+        x[i] = phi * x[i - 1] + noise[i]
+    return x
+
+
+def test_blocking_ar1():
+    phi = 0.8
+    n = 2 ** 17
+    k_blocking = blocking.Blocking()
+    for value in ar1_series(phi, n, 0):
+        k_blocking.add(value)
+    error, tau, plateau = k_blocking.error()
+    # unit innovations: the long time variance is 1 / (1 - phi)**2 and tau_int = (1 + phi) / (2 (1 - phi)). The
+    # plateau level itself only has a few blocks, so allow for its noise
+    assert plateau
+    assert abs(error / (1.0 / (1.0 - phi) / np.sqrt(n)) - 1.0) < 0.25
+    assert abs(tau / (0.5 * (1.0 + phi) / (1.0 - phi)) - 1.0) < 0.5
+
+
+def test_blocking_uncorrelated():
+    k_blocking = blocking.Blocking()
+    values = np.random.RandomState(5).normal(size=4096)
+    for value in values:
+        k_blocking.add(value)
+    error, tau, plateau = k_blocking.error()
+    assert np.isclose(k_blocking.mean(), values.mean())
+    assert abs(error * np.sqrt(len(values)) - 1.0) < 0.15
+
+
+def test_restore_blocks_k_past_begin_cov_check():
+    series = analysis.KSeries(begin_cov_check=100, k_conv_error_buffer=5)
+    for i in range(20):
+        series.add(float(i), 0.0, 0.0, i, 20 * i)
+    checkpoint = dict(k_list=np.array(series.k_list), dt_dx_list=np.array(series.dt_dx_list),
+                      heat_flux_list=np.array(series.heat_flux_list), timestep_list=np.array(series.timestep_list),
+                      walkers_list=np.array(series.walkers_list))
+    restored = analysis.KSeries(begin_cov_check=100, k_conv_error_buffer=5)
+    restored.restore(checkpoint)
+    assert restored.k_blocking.count[0] == series.k_blocking.count[0] == 14
+    assert restored.k_blocking.mean() == series.k_blocking.mean()
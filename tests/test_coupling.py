@@ -0,0 +1,33 @@
+"""test_coupling.py
+CONDUCTION package
+
+Spread of k over seeds with the hot and cold walkers of a pair independent and on common random numbers."""
+
+from __future__ import division
+import numpy as np
+
+from conduction import analysis
+from conduction import creation_2d
+from conduction import rules_onlat
+from conduction import scheduler
+
+
+def test_common_coupling_narrows_k(tmp_path):
+    # empty box, k = 0.5
+    grid = creation_2d.Grid2D_onlat(10, 4, 0, 'random', 0, False, str(tmp_path), False, False, False)
+    num_pairs = 500
+    tot_time = 200
+    num_seeds = 40
+    slot_times, slot_pairs = scheduler.injection_slots(num_pairs, tot_time)
+    spread = {}
+    for coupling in ['independent', 'common']:
+        ks = []
+        for seed in range(num_seeds):
+            deltas, paths = rules_onlat.walk_slots_onlat(grid, 'vectorized', np.arange(len(slot_times)), slot_times,
+                                                         slot_pairs, False, 0.5, False, seed, 1, coupling=coupling)
+            fit = analysis.ProfileFit(grid.size, 2)
+            fit.add_deltas(deltas)
+            ks.append(fit.fit(2 * num_pairs, tot_time)[3])
+        spread[coupling] = (np.mean(ks), np.std(ks, ddof=1))
+    assert spread['common'][1] < spread['independent'][1]
+    assert abs(spread['common'][0] - spread['independent'][0]) < 3.0 * spread['independent'][1] / np.sqrt(num_seeds)
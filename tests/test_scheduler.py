@@ -0,0 +1,29 @@
+"""test_scheduler.py
+CONDUCTION package
+
+The slots of the injection schedule cover every walker pair once, for pair counts that do and do not divide the
+timesteps."""
+
+from __future__ import division
+import numpy as np
+
+from conduction import scheduler
+
+
+def test_injection_slots_cover_every_pair_once():
+    for num_pairs, tot_time in [(1, 1), (7, 3), (100, 100), (600, 300), (1200, 200), (301, 1000), (999, 37)]:
+        slot_times, slot_pairs = scheduler.injection_slots(num_pairs, tot_time)
+        assert len(slot_pairs) == len(slot_times) + 1
+        assert slot_pairs[0] == 0 and slot_pairs[-1] == num_pairs
+        assert np.all(np.diff(slot_pairs) > 0)  # no empty slot, so every pair is in exactly one
+        assert np.all(np.diff(slot_times) > 0)  # one slot per injection timestep
+        assert np.all((slot_times >= 0) & (slot_times < tot_time))
+        pairs = np.concatenate([np.arange(slot_pairs[s], slot_pairs[s + 1]) for s in range(len(slot_times))])
+        assert np.array_equal(pairs, np.arange(num_pairs))
+        assert np.array_equal(np.repeat(slot_times, np.diff(slot_pairs)),
+                              scheduler.injection_times(num_pairs, tot_time))
+        # static schedule, core rank walks slots rank, rank + size, ...
+        for size in (1, 3, 8):
+            owned = np.concatenate([np.arange(slot_pairs[s], slot_pairs[s + 1])
+                                    for rank in range(size) for s in range(rank, len(slot_times), size)])
+            assert np.array_equal(np.sort(owned), np.arange(num_pairs))
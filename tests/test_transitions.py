@@ -0,0 +1,68 @@
+"""test_transitions.py
+CONDUCTION package
+
+The compiled transition table against the scalar rules of rules_onlat, every square and move choice of fixed grids
+of each model."""
+
+from __future__ import division
+import numpy as np
+
+from conduction import creation_2d
+from conduction import creation_3d
+from conduction import creation_onlat
+from conduction import random_streams
+from conduction import rules_onlat
+
+
+class ForcedDraws(object):
+    """Stands in for np.random in the scalar rules, the move choice is choice and every uniform is u"""
+    def __init__(self, choice, u):
+        self.choice = choice
+        self.u = u
+        self.num_choices = None
+
+    def randint(self, low, high):
+        self.num_choices = high
+        return self.choice
+
+    def random(self, size=None):
+        if size is None:
+            return self.u
+        return np.zeros(size) + self.u
+
+
+def fixed_grid(dim, tube_radius, disable_func, inert_vol, plot_save_dir):
+    np.random.seed(random_streams.legacy_seed(7))
+    grid_class = creation_2d.Grid2D_onlat if dim == 2 else creation_3d.Grid3D_onlat
+    return grid_class(9, 4, 4, 'horizontal', tube_radius, False, plot_save_dir, disable_func, False, inert_vol)
+
+
+def check_table(grid, kapitza, prob_m_cn):
+    table = grid.compile_transitions(kapitza, prob_m_cn)
+    for cur in range(int(np.prod(table.shape))):
+        cur_pos = np.asarray(np.unravel_index(cur, table.shape))
+        for choice in range(table.num_choices[cur]):
+            # u = 0 accepts dest_a, u just below 1 takes dest_b
+            for u, dest in [(0.0, table.dest_a[cur, choice]), (1.0 - 1e-9, table.dest_b[cur, choice])]:
+                if u > 0 and not table.partial[cur, choice]:
+                    dest = table.dest_a[cur, choice]
+                rng = ForcedDraws(choice, u)
+                walker = creation_onlat.Walker_onlat(grid.size, len(cur_pos), 'hot', False, rng, start=cur_pos[1:])
+                walker.cur_pos[:] = cur_pos
+                walker, inside_cnt = rules_onlat.apply_moves(walker, kapitza, grid, prob_m_cn, False, grid.bound,
+                                                             rng=rng)
+                final = np.ravel_multi_index(tuple(walker.cur_pos), table.shape)
+                assert rng.num_choices == table.num_choices[cur]
+                if dest >= 0:
+                    assert final == dest
+                else:  # uniform over the squares of tube -(dest + 1)
+                    assert final in table.squares_of_tube(-dest - 1)
+
+
+def test_table_matches_scalar_rules(tmp_path):
+    for dim in (2, 3):
+        # kapitza, tunneling with and without volume as mpi_run sets them up, and kapitza with volume squares
+        check_table(fixed_grid(dim, 0.5, False, False, str(tmp_path)), True, 0.3)
+        check_table(fixed_grid(dim, 0.5, False, True, str(tmp_path)), True, 0.3)
+        check_table(fixed_grid(dim, 0.5, False, True, str(tmp_path)), False, 0.0)
+        check_table(fixed_grid(dim, 0.0, False, False, str(tmp_path)), False, 0.0)